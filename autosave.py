@@ -0,0 +1,129 @@
+"""Periodisk autosave, som ikke blokerer input og rendering.
+
+Main-tråden tager kun en billig kopi af spillet (`savefile.snapshot`). Palette, packbits, JSON,
+deltaen til en inkrementel save, komprimering og skrivning sker i en baggrundsproces,
+så de heller ikke holder GIL'en fra main-tråden. En baggrundstråd venter på processen,
+og sørger for at kun det nyeste snapshot skrives hvis der kommer flere imens.
+"""
+from __future__ import annotations
+
+import concurrent.futures
+import concurrent.futures.process
+import multiprocessing
+import threading
+import traceback
+from typing import Optional, TYPE_CHECKING
+
+import savefile
+
+if TYPE_CHECKING:
+    from engine import Engine
+
+
+class AutoSaver:
+    def __init__(
+            self,
+            filename: str,
+            every_n_turns: int = 50,
+            incremental: bool = False,
+            compression: str = savefile.DEFAULT_COMPRESSION,
+    ):
+        """
+        Args:
+            filename (str): Filen der gemmes til.
+            every_n_turns (int): Gem efter så mange ture. Der gemmes også altid ved skift af etage.
+            incremental (bool): Tilføj kun ændringerne til filen, se `savefile.JournalWriter`.
+            compression (str): Codec og level, fx "zlib:6", se `savefile.CODECS`.
+        """
+        savefile.parse_compression(compression)
+        self.filename = filename
+        self.every_n_turns = every_n_turns
+        self.compression = compression
+        self.incremental = incremental
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="autosave")
+        self._process: Optional[concurrent.futures.ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._writing = False
+        self._queued: Optional[savefile.Snapshot] = None
+        self._engine: Optional[Engine] = None
+        self._last_turn = 0
+        self._last_floor = 0
+
+    def maybe_save(self, engine: Engine) -> None:
+        """Kaldes efter hver tur; starter en autosave hvis det er tid til det."""
+        floor = engine.game_world.current_floor
+        if engine is not self._engine:
+            # Nyt eller indlæst spil, start tællingen forfra.
+            self._engine, self._last_turn, self._last_floor = engine, engine.turn, floor
+        elif floor != self._last_floor or engine.turn - self._last_turn >= self.every_n_turns:
+            self.save(engine)
+
+    def save(self, engine: Engine) -> None:
+        """Tag et snapshot nu, og skriv det i baggrunden."""
+        self._engine, self._last_turn, self._last_floor = engine, engine.turn, engine.game_world.current_floor
+        snapshot = savefile.snapshot(engine)
+        with self._lock:
+            if self._writing:
+                # Der skrives allerede; kun det nyeste snapshot skal skrives bagefter.
+                self._queued = snapshot
+                return
+            self._writing = True
+        self._executor.submit(self._write, snapshot)
+
+    def _write(self, snapshot: savefile.Snapshot) -> None:
+        while True:
+            try:
+                self._write_in_process(snapshot)
+            except Exception:
+                traceback.print_exc()
+            with self._lock:
+                if self._queued is None:
+                    self._writing = False
+                    return
+                snapshot, self._queued = self._queued, None
+
+    def _write_in_process(self, snapshot: savefile.Snapshot) -> None:
+        """Skriv `snapshot` i baggrundsprocessen og vent på den. Hvis processen er død, startes en ny."""
+        if self._process is None:
+            # "spawn" af samme grund som i `prefetch`: fork kopierer kun den kaldende tråd.
+            self._process = concurrent.futures.ProcessPoolExecutor(
+                max_workers=1,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(self.filename, self.incremental, self.compression),
+            )
+        try:
+            self._process.submit(_write_snapshot, snapshot).result()
+        except concurrent.futures.process.BrokenProcessPool:
+            # En ny proces har ikke den forrige save, så en inkrementel save starter forfra med en fuld record.
+            self._process.shutdown(wait=False)
+            self._process = None
+            raise
+
+    def close(self) -> None:
+        """Vent på en igangværende autosave og stop baggrundstråden og -processen."""
+        self._executor.shutdown(wait=True)
+        if self._process is not None:
+            self._process.shutdown(wait=True)
+            self._process = None
+
+
+# Sættes i baggrundsprocessen af `_init_worker`.
+_filename = ""
+_compression = savefile.DEFAULT_COMPRESSION
+_journal: Optional[savefile.JournalWriter] = None
+
+
+def _init_worker(filename: str, incremental: bool, compression: str) -> None:
+    global _filename, _compression, _journal
+    _filename, _compression = filename, compression
+    _journal = savefile.JournalWriter(filename, compression=compression) if incremental else None
+
+
+def _write_snapshot(snapshot: savefile.Snapshot) -> None:
+    """Kører i baggrundsprocessen: lav sektionerne og skriv dem, som fuld save eller som delta."""
+    sections = savefile.encode_snapshot(snapshot)
+    if _journal is not None:
+        _journal.write(sections)
+    else:
+        savefile.write_atomic(_filename, savefile.pack(sections, _compression))
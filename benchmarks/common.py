@@ -0,0 +1,52 @@
+"""Fælles hjælpere til benchmarks: seeded spil uden vindue."""
+from __future__ import annotations
+
+import random
+
+import numpy as np
+
+from engine import Engine
+import entity_factories
+from game_map import GameWorld
+from procgen import generate_dungeon
+
+
+def build_engine(width: int = 80, height: int = 43, seed: int = 0) -> Engine:
+    """Generer et seeded spil i den givne kortstørrelse, uden vindue eller tileset.
+
+    Antallet af rum skaleres med arealet, så tætheden er den samme som på 80x43 med 30 rum.
+    """
+    random.seed(seed)
+    engine = Engine(player=entity_factories.player.clone())
+    engine.game_world = GameWorld(
+        engine=engine,
+        map_width=width,
+        map_height=height,
+        max_rooms=max(30, width * height // 115),
+        room_min_size=6,
+        room_max_size=10,
+        max_monsters_per_room=2,
+        max_items_per_room=2,
+        seed=seed,
+    )
+    engine.game_world.generate_floor()
+    engine.update_fov()
+    return engine
+
+
+def fill_with_monsters(engine: Engine, count: int, seed: int = 0) -> None:
+    """Erstat kortets monstre med `count` orker på tilfældige frie gulv-tiles."""
+    game_map = engine.game_map
+    for actor in list(game_map.actors):
+        if actor is not engine.player:
+            game_map.remove_entity(actor)
+
+    rng = np.random.default_rng(seed)
+    free = game_map.tiles['walkable'].copy()
+    for entity in game_map.entities:
+        free[entity.x, entity.y] = False
+    xs, ys = np.nonzero(free)
+    if len(xs) < count:
+        raise ValueError(f"Map only has room for {len(xs)} monsters, not {count}.")
+    chosen = rng.choice(len(xs), size=count, replace=False)
+    entity_factories.orc.spawn_many(game_map, xs[chosen], ys[chosen])
@@ -0,0 +1,54 @@
+"""Mål hukommelse pr. entity, item og besked, samt pickle-størrelse pr. entity.
+
+Køres fra roden af repoet:
+
+    python -m benchmarks.entity_memory
+"""
+import argparse
+import pickle
+import tracemalloc
+from typing import Callable
+
+from benchmarks.common import build_engine
+import color
+import entity_factories
+from message_log import MessageLog
+
+
+def bytes_per_object(make: Callable[[], object], count: int) -> float:
+    """Gennemsnitlig allokeret hukommelse pr. objekt som `make` laver."""
+    keep = []
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    for _ in range(count):
+        keep.append(make())
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    allocated = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    return allocated / count
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--count", type=int, default=2000)
+    args = parser.parse_args()
+
+    engine = build_engine(200, 120)
+    game_map = engine.game_map
+    message_log = MessageLog(max_messages=args.count)  # Ellers falder beskeder ud undervejs og måles ikke.
+
+    orcs = bytes_per_object(lambda: entity_factories.orc.spawn(game_map, 1, 1), args.count)
+    potions = bytes_per_object(lambda: entity_factories.health_potion.spawn(game_map, 1, 1), args.count)
+    messages = bytes_per_object(
+        lambda: message_log.add_message(f"{len(message_log.messages)}", color.white), args.count,
+    )
+    orc_pickle = len(pickle.dumps(entity_factories.orc))
+
+    print(f"Actor (orc), inkl. komponenter: {orcs:8.0f} bytes")
+    print(f"Item (potion), inkl. komponent: {potions:8.0f} bytes")
+    print(f"Message:                        {messages:8.0f} bytes")
+    print(f"Pickle af orc-prototype:        {orc_pickle:8d} bytes")
+
+
+if __name__ == "__main__":
+    main()
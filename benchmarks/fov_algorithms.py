@@ -0,0 +1,51 @@
+"""Sammenlign tcods FOV-algoritmer på vores kortstørrelser.
+
+Køres fra roden af repoet:
+
+    python -m benchmarks.fov_algorithms
+"""
+import argparse
+import timeit
+from typing import List, Tuple
+
+import tcod.constants
+from tcod.map import compute_fov
+
+from benchmarks.common import build_engine
+
+ALGORITHMS = {
+    "BASIC": tcod.constants.FOV_BASIC,
+    "DIAMOND": tcod.constants.FOV_DIAMOND,
+    "SHADOW": tcod.constants.FOV_SHADOW,
+    "PERMISSIVE_4": tcod.constants.FOV_PERMISSIVE_4,
+    "PERMISSIVE_8": tcod.constants.FOV_PERMISSIVE_8,
+    "RESTRICTIVE": tcod.constants.FOV_RESTRICTIVE,
+    "SYMMETRIC_SHADOWCAST": tcod.constants.FOV_SYMMETRIC_SHADOWCAST,
+}
+
+MAP_SIZES: List[Tuple[int, int]] = [(80, 43), (200, 120), (500, 300)]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--radius", type=int, default=8, help="FOV radius, 0 er ubegrænset.")
+    parser.add_argument("--number", type=int, default=200, help="Kald pr. måling.")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    for width, height in MAP_SIZES:
+        engine = build_engine(width, height, args.seed)
+        transparency = engine.game_map.tiles['transparent']
+        pov = engine.player.x, engine.player.y
+        print(f"{width}x{height}, radius={args.radius}")
+        for name, algorithm in ALGORITHMS.items():
+            seconds = min(timeit.repeat(
+                lambda: compute_fov(transparency, pov, radius=args.radius, algorithm=algorithm),
+                number=args.number,
+                repeat=3,
+            ))
+            print(f"  {name:<22} {seconds / args.number * 1e6:10.1f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""Mål tid og størrelse for hver save-codec på en given save.
+
+Køres fra roden af repoet:
+
+    python -m benchmarks.save_codecs savegame.sav
+    python -m benchmarks.save_codecs -c zlib:1 -c lzma:1
+
+Uden en fil måles på et nyt spil. Den valgte codec sættes med `ROGUEPY_SAVE_COMPRESSION`.
+"""
+import argparse
+import timeit
+from typing import List, Optional
+
+from benchmarks.common import build_engine
+import savefile
+
+COMPRESSIONS: List[str] = [
+    "none",
+    "zlib:1", "zlib:6", "zlib:9",
+    "lzma:0", "lzma:1", "lzma:6", "lzma:9",
+    "bz2:1", "bz2:9",
+]
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("save", nargs="?", help="Save-fil at måle på.")
+    parser.add_argument(
+        "-c", "--compression", action="append",
+        help="Codec og level at måle, fx zlib:6. Kan gentages; default er en række af dem alle.",
+    )
+    parser.add_argument("--number", type=int, default=20, help="Kald pr. måling.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed til et nyt spil, når der ikke er en fil.")
+    args = parser.parse_args(argv)
+
+    compressions = args.compression or COMPRESSIONS
+    for compression in compressions:
+        savefile.parse_compression(compression)
+
+    engine = savefile.load(args.save) if args.save else build_engine(80, 43, args.seed)
+    sections = savefile.encode_sections(engine)
+    raw_size = sum(len(data) for data in sections.values())
+    print(f"{args.save or 'new game'}: {raw_size} bytes in {len(sections)} sections")
+    print(f"  {'codec':<10} {'bytes':>8} {'ratio':>7} {'pack':>10} {'unpack':>10}")
+
+    for compression in compressions:
+        data = savefile.pack(sections, compression)
+        pack_seconds = min(timeit.repeat(
+            lambda: savefile.pack(sections, compression), number=args.number, repeat=3,
+        ))
+        unpack_seconds = min(timeit.repeat(
+            lambda: savefile.unpack(data), number=args.number, repeat=3,
+        ))
+        print(
+            f"  {compression:<10} {len(data):8d} {len(data) / raw_size:7.2f}"
+            f" {pack_seconds / args.number * 1e3:8.2f}ms {unpack_seconds / args.number * 1e3:8.2f}ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,247 @@
+"""Seeded benchmark-suite for spillets varme stier.
+
+Køres fra roden af repoet:
+
+    python -m benchmarks.suite                       # Kør og sammenlign med baseline
+    python -m benchmarks.suite --save-baseline       # Gem resultatet som ny baseline
+    python -m benchmarks.suite -k fov --json out.json
+
+Resultaterne skrives som JSON, og hvis der findes en baseline bliver hver måling sammenlignet med den.
+Tiderne afhænger af maskinen, så baseline.json er ikke i repoet; lav den selv med --save-baseline.
+Uden en baseline skrives en advarsel, og intet sammenlignes.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import timeit
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+import tcod
+from tcod.console import Console
+
+from benchmarks.common import build_engine, fill_with_monsters
+import color
+from procgen import generate_dungeon
+import setup_game
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+Case = Callable[[int], Callable[[], object]]
+"""En benchmark tager et seed, laver sin opsætning og returnerer funktionen der skal tidtages."""
+
+CASES: Dict[str, Case] = {}
+
+
+def benchmark(name: str) -> Callable[[Case], Case]:
+    def register(case: Case) -> Case:
+        CASES[name] = case
+        return case
+    return register
+
+
+def _procgen_case(width: int, height: int) -> Case:
+    def case(seed: int) -> Callable[[], object]:
+        engine = build_engine(seed=seed)
+
+        def run():
+            # Ny RNG med samme seed i hvert kald, så hvert kald genererer den samme etage.
+            return generate_dungeon(
+                max_rooms=max(30, width * height // 115),
+                room_min_size=6,
+                room_max_size=10,
+                map_width=width,
+                map_height=height,
+                max_monsters_per_room=2,
+                max_items_per_room=2,
+                engine=engine,
+                rng=random.Random(seed),
+            )
+        return run
+    return case
+
+
+for _width, _height in [(80, 43), (200, 120), (500, 300)]:
+    benchmark(f"procgen.generate_dungeon[{_width}x{_height}]")(_procgen_case(_width, _height))
+
+
+def _enemy_turns_case(monsters: int) -> Case:
+    def case(seed: int) -> Callable[[], object]:
+        engine = build_engine(200, 120, seed)
+        fill_with_monsters(engine, monsters, seed)
+        # Spilleren må ikke dø undervejs, og alle monstre skal kunne se spilleren og jage.
+        engine.player.fighter.max_hp = engine.player.fighter.hp = 10 ** 9
+        engine.game_map.visible[:] = True
+        start = [(actor, actor.x, actor.y) for actor in engine.game_map.actors if actor is not engine.player]
+
+        def run():
+            # Sæt monstrene tilbage før hvert kald, så alle kald måler den samme tur (jagt på afstand),
+            # og ikke monstre der efterhånden står samlet om spilleren og angriber.
+            for actor, x, y in start:
+                if actor.x != x or actor.y != y:
+                    actor.place(x, y)
+                actor.ai.path = []
+            engine.player.fighter.hp = engine.player.fighter.max_hp
+            engine.handle_enemy_turns()
+        return run
+    return case
+
+
+for _monsters in [10, 100, 1000]:
+    benchmark(f"engine.handle_enemy_turns[{_monsters}]")(_enemy_turns_case(_monsters))
+
+
+@benchmark("engine.update_fov")
+def _update_fov(seed: int) -> Callable[[], object]:
+    engine = build_engine(seed=seed)
+
+    def run():
+        engine._fov_key = None  # Mål selve udregningen, ikke cachen.
+        engine.update_fov()
+    return run
+
+
+@benchmark("game_map.render")
+def _game_map_render(seed: int) -> Callable[[], object]:
+    engine = build_engine(seed=seed)
+    engine.game_map.explored[:] = True
+    console = Console(engine.game_map.width, engine.game_map.height, order="F")
+    return lambda: engine.game_map.render(console)
+
+
+@benchmark("game_map.render[1000 entities]")
+def _game_map_render_entities(seed: int) -> Callable[[], object]:
+    engine = build_engine(200, 120, seed)
+    fill_with_monsters(engine, 1000, seed)
+    engine.game_map.visible[:] = True  # Alle entities i `view` skal tegnes.
+    console = Console(80, 50, order="F")
+    return lambda: engine.game_map.render(console)
+
+
+@benchmark("game_map.render[dirty]")
+def _game_map_render_dirty(seed: int) -> Callable[[], object]:
+    engine = build_engine(seed=seed)
+    game_map = engine.game_map
+    game_map.explored[:] = True
+    console = Console(game_map.width, game_map.height, order="F")
+
+    def run():
+        game_map.mark_dirty(0, 0, game_map.width, game_map.height)  # Som efter hver tur.
+        game_map.render(console)
+    return run
+
+
+@benchmark("message_log.render")
+def _message_log_render(seed: int) -> Callable[[], object]:
+    engine = build_engine(seed=seed)
+    rng = random.Random(seed)
+    for i in range(1000):
+        engine.message_log.add_message(f"Message {i} " + "word " * rng.randint(1, 20), color.white)
+    console = Console(80, 50, order="F")
+    return lambda: engine.message_log.render(console=console, x=21, y=45, width=40, height=5)
+
+
+@benchmark("engine.save_as+load_game")
+def _save_load(seed: int) -> Callable[[], object]:
+    engine = build_engine(seed=seed)
+    # Slettes når `run` ikke bruges mere, eller senest når Python afslutter.
+    directory = tempfile.TemporaryDirectory(prefix="roguepy-bench-")
+
+    def run():
+        path = os.path.join(directory.name, "bench.sav")
+        engine.save_as(path)
+        return setup_game.load_game(path)
+    return run
+
+
+def run_case(case: Case, seed: int, repeat: int) -> Dict[str, float]:
+    """Tidtag en benchmark og returner sekunder pr. kald."""
+    timer = timeit.Timer(case(seed))
+    number, _ = timer.autorange()  # Mindst 0.2 sekunder pr. måling.
+    samples = [t / number for t in timer.repeat(repeat=repeat, number=number)]
+    return {
+        "min": min(samples),
+        "median": statistics.median(samples),
+        "number": number,
+        "repeat": repeat,
+    }
+
+
+def compare(results: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]], tolerance: float) -> List[str]:
+    """Sammenlign med baseline og returner navnene på de målinger der er blevet langsommere."""
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            print(f"  {name:<42} {result['min'] * 1e3:10.3f} ms   (ny)")
+            continue
+        ratio = result["min"] / baseline[name]["min"]
+        if ratio > 1 + tolerance:
+            verdict = "LANGSOMMERE"
+            regressions.append(name)
+        elif ratio < 1 - tolerance:
+            verdict = "hurtigere"
+        else:
+            verdict = ""
+        print(f"  {name:<42} {result['min'] * 1e3:10.3f} ms   x{ratio:5.2f} {verdict}")
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Run the seeded benchmark suite.")
+    parser.add_argument("-k", dest="filter", default="", help="Kør kun benchmarks hvis navn indeholder denne tekst.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--json", dest="json_path", help="Skriv resultaterne til denne fil.")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="Gem resultaterne som ny baseline.")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Relativ ændring der tæller som en forskel.")
+    args = parser.parse_args(argv)
+
+    results: Dict[str, Dict[str, float]] = {}
+    for name, case in CASES.items():
+        if args.filter in name:
+            results[name] = run_case(case, args.seed, args.repeat)
+
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "tcod": tcod.__version__,
+            "platform": platform.platform(),
+            "seed": args.seed,
+        },
+        "results": results,
+    }
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(report, f, indent=2)
+
+    baseline: Dict[str, Dict[str, float]] = {}
+    if not args.save_baseline:
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                baseline = json.load(f)["results"]
+        else:
+            print(
+                f"Warning: no baseline at {args.baseline}, nothing was compared. "
+                f"Create one on this machine with --save-baseline.",
+                file=sys.stderr,
+            )
+    regressions = compare(results, baseline, args.tolerance)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,291 @@
+"""Kort til meget store verdener, hvor kun de chunks der bliver brugt er allokeret og genereret.
+
+`ChunkedGameMap.tiles`, `visible` og `explored` er `ChunkedArray`s, som kan indexeres som de tætte
+NumPy arrays på `GameMap` med (x, y), slices, index-arrays og felt-navne som `tiles['walkable']`.
+Hukommelse og genereringstid afhænger derfor af hvor meget spilleren har udforsket, ikke af kortets størrelse.
+"""
+from __future__ import annotations
+
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple, TYPE_CHECKING
+
+import numpy as np
+
+from game_map import GameMap
+import tile_types
+
+if TYPE_CHECKING:
+    from engine import Engine
+    from entity import Entity
+
+ChunkKey = Tuple[int, int]
+ChunkGenerator = Callable[["ChunkedGameMap", int, int], None]
+
+
+class ChunkedArray:
+    """Et 2D array i (x, y) delt op i kvadratiske chunks, som først allokeres når de bruges.
+
+    Ikke-allokerede chunks læses som `fill_value`. Hvis `on_allocate` er givet, allokeres (og genereres)
+    en chunk også når den læses, så indholdet altid er det samme uanset hvornår den bliver rørt ved.
+    """
+
+    def __init__(
+            self,
+            shape: Tuple[int, int],
+            chunk_size: int,
+            fill_value: Any,
+            dtype: Any = None,
+            on_allocate: Optional[Callable[[int, int], None]] = None,
+    ):
+        self.shape = shape
+        self.chunk_size = chunk_size
+        self._fill = np.full((), fill_value, dtype=dtype)
+        self._chunk_fill = self._fill  # Felt-views deler chunks, men allokerer dem stadig med hele dtypen.
+        self.dtype = self._fill.dtype
+        self.on_allocate = on_allocate
+        self.chunks: Dict[ChunkKey, np.ndarray] = {}
+        self._field: Optional[str] = None
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return self._field_view(key)
+        x, y = self._split_key(key)
+        if isinstance(x, slice) or isinstance(y, slice):
+            return self._get_region(x, y)
+        if isinstance(x, np.ndarray) or isinstance(y, np.ndarray):
+            return self._get_points(x, y)
+        chunk = self._chunk_at(x, y, allocate=self.on_allocate is not None)
+        if chunk is None:
+            return self._fill[()]
+        size = self.chunk_size
+        return self._view(chunk)[x % size, y % size]
+
+    def __setitem__(self, key, value) -> None:
+        x, y = self._split_key(key)
+        if isinstance(x, slice) or isinstance(y, slice):
+            self._set_region(x, y, value)
+        elif isinstance(x, np.ndarray) or isinstance(y, np.ndarray):
+            self._set_points(x, y, value)
+        else:
+            size = self.chunk_size
+            self._view(self._chunk_at(x, y, allocate=True))[x % size, y % size] = value
+
+    def region(self, x1: int, y1: int, x2: int, y2: int, allocate: Optional[bool] = None) -> np.ndarray:
+        """Returnerer en kopi af [x1, x2) x [y1, y2).
+
+        Med `allocate=False` læses ikke-allokerede chunks som `fill_value` uden at blive genereret.
+        """
+        if allocate is None:
+            allocate = self.on_allocate is not None
+        out = np.full((max(0, x2 - x1), max(0, y2 - y1)), self._fill, order='F')
+        for (cx1, cy1, cx2, cy2), chunk in self._chunks_in(x1, y1, x2, y2, allocate):
+            out[cx1 - x1:cx2 - x1, cy1 - y1:cy2 - y1] = self._local(chunk, cx1, cy1, cx2, cy2)
+        return out
+
+    def allocate_region(self, x1: int, y1: int, x2: int, y2: int) -> None:
+        """Allokér (og generer) alle chunks som overlapper [x1, x2) x [y1, y2)."""
+        for _ in self._chunks_in(x1, y1, x2, y2, allocate=True):
+            pass
+
+    def stack(self, keys: Iterable[ChunkKey]) -> np.ndarray:
+        """Returnerer chunks'ene for `keys` lagt i forlængelse af hinanden langs x, fx til en save."""
+        size = self.chunk_size
+        blocks = [self._view(self.chunks[key]) if key in self.chunks else np.full((size, size), self._fill)
+                  for key in keys]
+        if not blocks:
+            return np.empty((0, size), dtype=self.dtype, order='F')
+        return np.asfortranarray(np.concatenate(blocks, axis=0))
+
+    def unstack(self, keys: List[ChunkKey], stacked: np.ndarray) -> None:
+        """Modsat `stack`: læg chunks'ene ind igen uden at generere dem."""
+        size = self.chunk_size
+        for i, key in enumerate(keys):
+            self.chunks[key] = np.asfortranarray(stacked[i * size:(i + 1) * size])
+
+    def _field_view(self, name: str) -> ChunkedArray:
+        view = ChunkedArray.__new__(ChunkedArray)
+        view.__dict__.update(self.__dict__)
+        view._field = name
+        view._fill = self._fill[name]
+        view.dtype = view._fill.dtype
+        return view
+
+    def _view(self, chunk: np.ndarray) -> np.ndarray:
+        return chunk if self._field is None else chunk[self._field]
+
+    def _split_key(self, key) -> Tuple[Any, Any]:
+        if key is Ellipsis or key == slice(None):
+            return slice(None), slice(None)
+        if not isinstance(key, tuple) or len(key) != 2:
+            raise TypeError(f"ChunkedArray only supports [x, y] indexing, not {key!r}.")
+        x, y = key
+        if not isinstance(x, (slice, np.ndarray)):
+            x = int(x)
+            if not 0 <= x < self.shape[0]:
+                raise IndexError(f"x index {x} is out of bounds for width {self.shape[0]}.")
+        if not isinstance(y, (slice, np.ndarray)):
+            y = int(y)
+            if not 0 <= y < self.shape[1]:
+                raise IndexError(f"y index {y} is out of bounds for height {self.shape[1]}.")
+        return x, y
+
+    def _bounds(self, x, y) -> Tuple[int, int, int, int, bool, bool]:
+        """Lav (x, y) om til et rektangel, og om hver akse skal fjernes fra resultatet (int index)."""
+        bounds = []
+        for index, length in ((x, self.shape[0]), (y, self.shape[1])):
+            if isinstance(index, slice):
+                start, stop, step = index.indices(length)
+                if step != 1:
+                    raise TypeError("ChunkedArray slices can not have a step.")
+                bounds.append((start, max(start, stop), False))
+            else:
+                bounds.append((index, index + 1, True))
+        (x1, x2, drop_x), (y1, y2, drop_y) = bounds
+        return x1, y1, x2, y2, drop_x, drop_y
+
+    def _get_region(self, x, y) -> np.ndarray:
+        x1, y1, x2, y2, drop_x, drop_y = self._bounds(x, y)
+        out = self.region(x1, y1, x2, y2)
+        return out[0 if drop_x else slice(None), 0 if drop_y else slice(None)]
+
+    def _set_region(self, x, y, value) -> None:
+        x1, y1, x2, y2, drop_x, drop_y = self._bounds(x, y)
+        value = np.asarray(value)
+        if value.ndim:
+            value = value.reshape((x2 - x1, y2 - y1), order='F')
+        for (cx1, cy1, cx2, cy2), chunk in self._chunks_in(x1, y1, x2, y2, allocate=True):
+            part = value[cx1 - x1:cx2 - x1, cy1 - y1:cy2 - y1] if value.ndim else value
+            self._local(chunk, cx1, cy1, cx2, cy2)[...] = part
+
+    def _get_points(self, xs, ys) -> np.ndarray:
+        xs, ys = np.broadcast_arrays(np.asarray(xs), np.asarray(ys))
+        out = np.full(xs.shape, self._fill)
+        size = self.chunk_size
+        allocate = self.on_allocate is not None
+        for (cx, cy), mask in self._group_points(xs, ys):
+            chunk = self._chunk(cx, cy, allocate)
+            if chunk is not None:
+                out[mask] = self._view(chunk)[xs[mask] % size, ys[mask] % size]
+        return out
+
+    def _set_points(self, xs, ys, value) -> None:
+        xs, ys = np.broadcast_arrays(np.asarray(xs), np.asarray(ys))
+        value = np.broadcast_to(np.asarray(value), xs.shape)
+        size = self.chunk_size
+        for (cx, cy), mask in self._group_points(xs, ys):
+            self._view(self._chunk(cx, cy, allocate=True))[xs[mask] % size, ys[mask] % size] = value[mask]
+
+    def _group_points(self, xs: np.ndarray, ys: np.ndarray):
+        cxs, cys = xs // self.chunk_size, ys // self.chunk_size
+        for cx, cy in set(zip(cxs.ravel().tolist(), cys.ravel().tolist())):
+            yield (cx, cy), (cxs == cx) & (cys == cy)
+
+    def _chunks_in(self, x1: int, y1: int, x2: int, y2: int, allocate: bool):
+        """Giver ((x1, y1, x2, y2), chunk) for hver chunk som overlapper rektanglet, i kort-koordinater."""
+        size = self.chunk_size
+        for cx in range(x1 // size, (x2 - 1) // size + 1 if x2 > x1 else x1 // size):
+            for cy in range(y1 // size, (y2 - 1) // size + 1 if y2 > y1 else y1 // size):
+                chunk = self._chunk(cx, cy, allocate)
+                if chunk is not None:
+                    yield (
+                        max(x1, cx * size), max(y1, cy * size),
+                        min(x2, (cx + 1) * size), min(y2, (cy + 1) * size),
+                    ), chunk
+
+    def _local(self, chunk: np.ndarray, x1: int, y1: int, x2: int, y2: int) -> np.ndarray:
+        """Returnerer et view af den del af `chunk` der dækker kort-rektanglet, som er inden i chunken."""
+        size = self.chunk_size
+        ox, oy = x1 // size * size, y1 // size * size
+        return self._view(chunk)[x1 - ox:x2 - ox, y1 - oy:y2 - oy]
+
+    def _chunk_at(self, x: int, y: int, allocate: bool) -> Optional[np.ndarray]:
+        return self._chunk(x // self.chunk_size, y // self.chunk_size, allocate)
+
+    def _chunk(self, cx: int, cy: int, allocate: bool) -> Optional[np.ndarray]:
+        chunk = self.chunks.get((cx, cy))
+        if chunk is None and allocate:
+            chunk = np.full((self.chunk_size, self.chunk_size), self._chunk_fill, order='F')
+            self.chunks[cx, cy] = chunk
+            if self.on_allocate is not None:
+                self.on_allocate(cx, cy)
+        return chunk
+
+
+class ChunkedGameMap(GameMap):
+    """Et `GameMap` hvor `tiles`, `visible` og `explored` er delt op i chunks, som genereres efterhånden.
+
+    `generate_chunk(game_map, cx, cy)` kaldes første gang en chunk i `tiles` bruges,
+    og må kun ændre tiles indenfor den chunk. FOV og pathfinding regner på de chunks
+    som er indenfor `active_radius` chunks af et punkt, som genereres når de kommer så tæt på.
+    """
+
+    def __init__(
+            self,
+            engine: Engine,
+            width: int,
+            height: int,
+            entities: Iterable[Entity] = (),
+            *,
+            generate_chunk: ChunkGenerator,
+            chunk_size: int = 32,
+            active_radius: int = 1,
+            view_width: int = 80,
+            view_height: int = 43,
+    ):
+        """
+        Args:
+            generate_chunk (ChunkGenerator): Genererer tiles og entities i chunk (cx, cy).
+            chunk_size (int): Bredde og højde på en chunk i tiles.
+            active_radius (int): Antal chunks omkring spilleren som er genereret og indgår i FOV og pathfinding.
+            view_width (int): Bredden på det udsnit af kortet som tegnes.
+            view_height (int): Højden på det udsnit af kortet som tegnes.
+        """
+        self.generate_chunk = generate_chunk
+        self.chunk_size = chunk_size
+        self.active_radius = active_radius
+        self.view_width = view_width
+        self.view_height = view_height
+        self._visible_area = (0, 0, 0, 0)
+        super().__init__(engine, width, height, entities)
+
+    def _create_layers(self, width: int, height: int) -> None:
+        size = self.chunk_size
+        self.tiles = ChunkedArray((width, height), size, tile_types.wall, on_allocate=self._generate_chunk)
+        self.visible = ChunkedArray((width, height), size, False)
+        self.explored = ChunkedArray((width, height), size, False)
+
+    @property
+    def generated_chunks(self) -> List[ChunkKey]:
+        """(cx, cy) for hver chunk som er genereret, sorteret."""
+        return sorted(self.tiles.chunks)
+
+    def _generate_chunk(self, cx: int, cy: int) -> None:
+        self.generate_chunk(self, cx, cy)
+        self.invalidate_transparency()
+
+    def get_active_area(self, x: int, y: int) -> Tuple[int, int, int, int]:
+        size, radius = self.chunk_size, self.active_radius
+        cx, cy = x // size, y // size
+        x1, y1 = max(0, (cx - radius) * size), max(0, (cy - radius) * size)
+        x2, y2 = min(self.width, (cx + radius + 1) * size), min(self.height, (cy + radius + 1) * size)
+        self.tiles.allocate_region(x1, y1, x2, y2)
+        return x1, y1, x2, y2
+
+    def dump_chunks(self) -> Tuple[List[ChunkKey], np.ndarray, np.ndarray, np.ndarray]:
+        """Returnerer de genererede chunks og deres `tiles`, `visible` og `explored` stablet, se `ChunkedArray.stack`."""
+        keys = self.generated_chunks
+        return keys, self.tiles.stack(keys), self.visible.stack(keys), self.explored.stack(keys)
+
+    def restore_chunks(
+            self, keys: List[ChunkKey], tiles: np.ndarray, visible: np.ndarray, explored: np.ndarray,
+    ) -> None:
+        """Modsat `dump_chunks`. Chunks'ene regnes som genererede, og bliver ikke genereret igen."""
+        self.tiles.unstack(keys, tiles)
+        self.visible.unstack(keys, visible)
+        self.explored.unstack(keys, explored)
+        self.mark_dirty(0, 0, self.width, self.height)
+        # Synligheden blev gemt, men ikke hvor den sidst blev sat, så ryd alle chunks med noget synligt næste gang.
+        size = self.chunk_size
+        shown = [key for i, key in enumerate(keys) if visible[i * size:(i + 1) * size].any()]
+        if shown:
+            cxs, cys = zip(*shown)
+            self._visible_area = min(cxs) * size, min(cys) * size, (max(cxs) + 1) * size, (max(cys) + 1) * size
@@ -1,12 +1,13 @@
 from __future__ import annotations
 
-import random
+import copy
 from typing import List, Optional, Tuple, TYPE_CHECKING
 
-import numpy as np
 import tcod
 
 from actions import Action, BumpAction, MeleeAction, MovementAction, WaitAction
+import instrumentation
+import rng as rng_streams
 
 if TYPE_CHECKING:
 	from entity import Actor
@@ -16,34 +17,44 @@ class BaseAI(Action):
 	def perform(self) -> None:
 		raise NotImplementedError()
 
+	def clone(self, entity: Actor) -> BaseAI:
+		""" Returnerer en kopi af denne AI, som styrer `entity`. """
+		clone = copy.copy(self)
+		clone.entity = entity
+		return clone
+
 	def get_path_to(self, dest_x, dest_y) -> List[Tuple[int, int]]:
 		""" Compute and return a path to the target position.
 
 		If there is no valid path then returns an empty list.
 		"""
-		# Kopier den 'walkable' list.
-		# Note `cost` fordi vi ser hvor meget tid det koster at komme over til målet.
-		cost = np.array(self.entity.game_map.tiles['walkable'], dtype=np.int8)
-
-		for entity in self.entity.game_map.entities:
-			# Check that an entity blocks movement and that cost isn't zero (blockin)
-			if entity.blocks_movement and cost[entity.x, entity.y]:
-				# Add to the cost of a blocked position
-				# A lower number means more enemies will crowd behind each other in hallways.
-				# A higher number means enemies will take longer paths in order to surround the player
-				cost[entity.x, entity.y] += 10  # This encourages the entity to move around that area, since the entity will try to go the path with the smallest cost
+		engine = self.engine
+		if (dest_x, dest_y) == (engine.player.x, engine.player.y):
+			# Alle der jagter spilleren deler ét distance-felt pr. tur.
+			distance, (x1, y1) = engine.get_player_distance_field()
+			start_x, start_y = self.entity.x - x1, self.entity.y - y1
+			if not (0 <= start_x < distance.shape[0] and 0 <= start_y < distance.shape[1]):
+				return []  # Udenfor det aktive område omkring spilleren.
+			path: List[List[int]] = tcod.path.hillclimb2d(distance, (start_x, start_y), True, True)[1:].tolist()
+			return [(index[0] + x1, index[1] + y1) for index in path]
+
+		instrumentation.count("astar_searches")
+		x1, y1, x2, y2 = self.entity.game_map.get_active_area(self.entity.x, self.entity.y)
+		if not (x1 <= dest_x < x2 and y1 <= dest_y < y2):
+			return []
+		cost = self.entity.game_map.get_movement_cost((x1, y1, x2, y2))
 
 		# Create a graph from the cost array and pass that graph to a new pathfinder
 		graph = tcod.path.SimpleGraph(cost=cost, cardinal=2, diagonal=3)
 		pathfinder = tcod.path.Pathfinder(graph)
 
-		pathfinder.add_root((self.entity.x, self.entity.y))  # Start position
+		pathfinder.add_root((self.entity.x - x1, self.entity.y - y1))  # Start position
 
 		# Compute the path to the destination and remove the starting point
-		path: List[List[int]] = pathfinder.path_to((dest_x, dest_y))[1:].tolist()
+		path = pathfinder.path_to((dest_x - x1, dest_y - y1))[1:].tolist()
 
 		# Convert from List[List[int]] to List[Tuple[int, int]]
-		return [(index[0], index[1]) for index in path]
+		return [(index[0] + x1, index[1] + y1) for index in path]
 
 
 class HostileEnemy(BaseAI):
@@ -51,6 +62,11 @@ class HostileEnemy(BaseAI):
 		super().__init__(entity)
 		self.path: List[Tuple[int, int]] = []
 
+	def clone(self, entity: Actor) -> HostileEnemy:
+		clone = super().clone(entity)
+		clone.path = list(self.path)
+		return clone
+
 	def perform(self):
 		target = self.engine.player
 		dir_x = target.x - self.entity.x
@@ -77,10 +93,22 @@ class ConfusedEnemy(BaseAI):
 	A confused enemy will stumble around aimlessly for a given number of turns, then revert back to its previous AI.
 	If an actor occupies a tile it is randomly moving into, it will attack.
 	"""
+	# Klasse-default, så saves fra før AI fik sin egen RNG stadig kan indlæses.
+	seed: int = 0
+
 	def __init__(self, entity: Actor, previous_ai: Optional[BaseAI], turns_remaining: int):
 		super().__init__(entity)
 		self.previous_ai = previous_ai
 		self.turns_remaining = turns_remaining
+		# Sin egen RNG-strøm, afledt af verdenens seed, så forvirringen er den samme hvis spillet genindlæses.
+		engine = self.engine
+		self.seed = engine.game_world.rng("confused", entity.uid, engine.turn).getrandbits(32)
+
+	def clone(self, entity: Actor) -> ConfusedEnemy:
+		clone = super().clone(entity)
+		if self.previous_ai:
+			clone.previous_ai = self.previous_ai.clone(entity)
+		return clone
 
 	def perform(self):
 		""" Revert the AI back to the original state if the effect is over. """
@@ -91,7 +119,7 @@ class ConfusedEnemy(BaseAI):
 			self.entity.ai = self.previous_ai
 		else:
 			# Pick a random direction
-			dir_x, dir_y = random.choice(
+			dir_x, dir_y = rng_streams.derive(self.seed, self.turns_remaining).choice(
 				[
                     (-1, -1),  # Northwest
                     (0, -1),  # North
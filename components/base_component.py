@@ -1,16 +1,26 @@
 from __future__ import annotations
 
+import copy
 from typing import TYPE_CHECKING
 
+from slotted import Slotted
+
 if TYPE_CHECKING:
 	from engine import Engine
 	from entity import Entity
 	from game_map import GameMap
 
 
-class BaseComponent:
+class BaseComponent(Slotted):
+	__slots__ = ('parent',)
 	parent: Entity  # Owning entity instance.
 
+	def clone(self, parent: Entity):
+		""" Returnerer en kopi af komponenten, som tilhører `parent`. """
+		clone = copy.copy(self)
+		clone.parent = parent
+		return clone
+
 	@property
 	def game_map(self):
 		return self.parent.game_map
@@ -19,6 +19,7 @@ if TYPE_CHECKING:
 
 
 class Consumable(BaseComponent):
+	__slots__ = ()
 	parent: Item
 
 	def get_action(self, consumer: Actor) -> Optional[ActionOrHandler]:
@@ -42,6 +43,8 @@ class Consumable(BaseComponent):
 
 
 class HealingConsumable(Consumable):
+	__slots__ = ('amount',)
+
 	def __init__(self, amount: int):
 		self.amount = amount
 
@@ -61,26 +64,18 @@ class HealingConsumable(Consumable):
 
 
 class LightningDamageConsumable(Consumable):
+	__slots__ = ('damage', 'maximum_range')
+
 	def __init__(self, damage: int, maximum_range: int):
 		self.damage = damage
 		self.maximum_range = maximum_range
 
 	def activate(self, action: actions.ItemAction):
 		consumer = action.entity
-		target = None
-		closest_distance = self.maximum_range + 1.0
-
-		for actor in self.engine.game_map.actors:
-			if (
-				actor.fighter
-				and actor != consumer
-				and self.parent.game_map.visible[actor.x, actor.y]
-			):
-				distance = consumer.distance(actor.x, actor.y)
-
-				if distance < closest_distance:
-					target = actor
-					closest_distance = distance
+		# Én vektoriseret afstands- og synligheds-udregning i stedet for en løkke over alle actors.
+		target = self.engine.game_map.get_nearest_visible_actor(
+			consumer.x, consumer.y, self.maximum_range + 1.0, exclude=consumer,
+		)
 
 		if target:
 			self.engine.message_log.add_message(
@@ -93,6 +88,8 @@ class LightningDamageConsumable(Consumable):
 
 
 class ConfusionConsumable(Consumable):
+	__slots__ = ('number_of_turns',)
+
 	def __init__(self, number_of_turns: int):
 		self.number_of_turns = number_of_turns
 
@@ -129,6 +126,8 @@ class ConfusionConsumable(Consumable):
 
 
 class FireballDamageConsumable(Consumable):
+	__slots__ = ('damage', 'radius')
+
 	def __init__(self, damage: int, radius: int):
 		self.damage = damage
 		self.radius = radius
@@ -150,16 +149,15 @@ class FireballDamageConsumable(Consumable):
 		if not self.engine.game_map.visible[target_xy]:
 			raise Impossible("You cannot target what you can't see.")
 
-		targets_hit = False
-		for actor in self.engine.game_map.actors:
-			if actor.distance(*target_xy) <= self.radius:
-				self.engine.message_log.add_message(
-					f"The {actor.name} is engulfed in a hell of your creation, and takes {self.damage} damage.",
-				)
-				actor.fighter.take_damage(self.damage)
-				targets_hit = True
-
-		if not targets_hit:
+		# Find alle ramte actors i ét vektoriseret opslag, og giv dem skaden bagefter.
+		targets = self.engine.game_map.get_actors_in_radius(*target_xy, self.radius)
+		if not targets:
 			raise Impossible("There's not targets in the area.")
 
+		for actor in targets:
+			self.engine.message_log.add_message(
+				f"The {actor.name} is engulfed in a hell of your creation, and takes {self.damage} damage.",
+			)
+			actor.fighter.take_damage(self.damage)
+
 		self.consume()
\ No newline at end of file
@@ -11,6 +11,7 @@ if TYPE_CHECKING:
 
 
 class Fighter(BaseComponent):
+    __slots__ = ('max_hp', '_hp', 'defense', 'power')
     parent: Actor
 
     def __init__(self, hp: int, defense: int, power: int):
@@ -30,6 +31,7 @@ class Fighter(BaseComponent):
         self._hp = max(0, min(value, self.max_hp))
         if self._hp == 0 and self.parent.ai:
             self.die()
+        self.parent.sync_columns()
 
     def die(self):
         if self.engine.player is self.parent:
@@ -45,6 +47,7 @@ class Fighter(BaseComponent):
         self.parent.ai = None
         self.parent.render_order = RenderOrder.CORPSE
         self.parent.name = f"a dead {self.parent.name}."
+        self.parent.sync_columns()
 
         self.engine.message_log.add_message(death_message, death_message_color)
         self.engine.player.level.add_xp(self.parent.level.xp_given)
@@ -9,12 +9,21 @@ if TYPE_CHECKING:
 
 
 class Inventory(BaseComponent):
+	__slots__ = ('capacity', 'items')
 	parent: Actor
 
 	def __init__(self, capacity: int):
 		self.capacity = capacity
 		self.items: List[Item] = []
 
+	def clone(self, parent: Actor) -> Inventory:
+		clone = super().clone(parent)
+		clone.items = []
+		for item in self.items:
+			item_clone = item.clone()
+			item_clone.parent = clone
+			clone.items.append(item_clone)
+		return clone
 
 	def drop(self, item: Item):
 		"""Fjerner en `Item` fra inventory, og placerer det i GameMap, hvor spilleren står.
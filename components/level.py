@@ -9,6 +9,7 @@ if TYPE_CHECKING:
 
 
 class Level(BaseComponent):
+    __slots__ = ('current_level', 'current_xp', 'level_up_base', 'level_up_factor', 'xp_given')
     parent: Actor
 
     def __init__(
@@ -63,6 +64,7 @@ class Level(BaseComponent):
 
     def increase_power(self, amount: int = 1) -> None:
         self.parent.fighter.power += amount
+        self.parent.sync_columns()
         self.engine.message_log.add_message(
             "Your muscles swell! A red mist covers your vision!"
         )
@@ -71,6 +73,7 @@ class Level(BaseComponent):
 
     def increase_defense(self, amount: int = 1) -> None:
         self.parent.fighter.defense += amount
+        self.parent.sync_columns()
         self.engine.message_log.add_message(
             "You think back on past relationships. Your resistance to pain increases."
         )
\ No newline at end of file
@@ -1,14 +1,17 @@
 from __future__ import annotations
-import lzma
-import pickle
-from typing import TYPE_CHECKING
+from typing import Optional, Tuple, TYPE_CHECKING
 
+import numpy as np
 from tcod.console import Console
+import tcod.constants
 from tcod.map import compute_fov
+import tcod.path
 
 import exceptions
+import instrumentation
 from message_log import MessageLog
 import render_functions
+import savefile
 
 if TYPE_CHECKING:
     from entity import Actor
@@ -19,35 +22,104 @@ class Engine:
     game_map: GameMap
     game_world: GameWorld
 
-    def __init__(self, player: Actor):
+    # Klasse-defaults, så saves fra før FOV-cachen stadig kan indlæses.
+    fov_radius: int = 8
+    fov_algorithm: int = tcod.constants.FOV_RESTRICTIVE
+    _fov_key: Optional[Tuple[int, int, int, int, int, int]] = None
+    turn: int = 0
+    # Tælles op af `EventHandler.handle_action` når spillet kan have ændret sig, se `BaseEventHandler.render_key`.
+    generation: int = 0
+    _journal: Optional[savefile.JournalWriter] = None
+
+    def __init__(
+            self,
+            player: Actor,
+            *,
+            fov_radius: int = 8,
+            fov_algorithm: int = tcod.constants.FOV_RESTRICTIVE,
+    ):
         """ Engine sørger for game logic
 
          Args:
             entities (Set[Entity]): *Unordered list of unique items.*
             event_handler (EventHandler): Gi'r jo sig selv.
             player (Entity): Godt nok, med lykke og held.
+            fov_radius (int): Hvor langt spilleren kan se. Defaults to 8.
+            fov_algorithm (int): En af `tcod.constants.FOV_*`. Defaults to FOV_RESTRICTIVE.
         """
         self.message_log = MessageLog()
         self.mouse_location = (0, 0)
         self.player = player
+        self._player_distance_field: Optional[np.ndarray] = None
+        self._player_distance_origin = (0, 0)
+        self.fov_radius = fov_radius
+        self.fov_algorithm = fov_algorithm
+        self.turn = 0  # Antal ture der er gået, tælles op af `EventHandler.handle_action`.
+        self.generation = 0
 
     def handle_enemy_turns(self):
-        for entity in set(self.game_map.actors) - {self.player}:
-            if entity.ai:
-                try:
-                    entity.ai.perform()
-                except exceptions.Impossible:
-                    pass
+        # Distance-feltet bygges først når en AI spørger efter det, og gælder kun denne tur.
+        self._player_distance_field = None
+        try:
+            for entity in set(self.game_map.actors) - {self.player}:
+                if entity.ai:
+                    try:
+                        entity.ai.perform()
+                    except exceptions.Impossible:
+                        pass
+        finally:
+            self._player_distance_field = None
+
+    def get_player_distance_field(self) -> Tuple[np.ndarray, Tuple[int, int]]:
+        """Returnerer et Dijkstra distance-felt med spilleren som rod, og kortets (x, y) for feltets [0, 0].
+
+        Feltet dækker `GameMap.get_active_area` omkring spilleren,
+        og bygges højst én gang pr. tur og deles af alle AIs som jagter spilleren.
+        """
+        if self._player_distance_field is None:
+            instrumentation.count("dijkstra_fields")
+            area = self.game_map.get_active_area(self.player.x, self.player.y)
+            cost = self.game_map.get_movement_cost(area)
+            distance = tcod.path.maxarray(cost.shape, dtype=np.int32, order='F')
+            distance[self.player.x - area[0], self.player.y - area[1]] = 0
+            tcod.path.dijkstra2d(distance, cost, 2, 3)
+            self._player_distance_field = distance
+            self._player_distance_origin = area[0], area[1]
+        return self._player_distance_field, self._player_distance_origin
 
     def update_fov(self):
-        """ Opdater `game_map` baseret på spillerens FOV"""
-        self.game_map.visible[:] = compute_fov(
-            self.game_map.tiles['transparent'],
-            (self.player.x, self.player.y),
-            radius=8,
+        """ Opdater `game_map` baseret på spillerens FOV
+
+        Resultatet genbruges så længe spilleren står stille og kortets gennemsigtighed er uændret.
+        """
+        # Først, da den kan generere chunks og dermed bumpe `transparency_generation`.
+        x1, y1, x2, y2 = self.game_map.get_active_area(self.player.x, self.player.y)
+        if self.fov_radius > 0:
+            # Intet udenfor radius kan ses, så FOV beregnes kun i kvadratet omkring spilleren.
+            radius = self.fov_radius
+            x1, y1 = max(x1, self.player.x - radius), max(y1, self.player.y - radius)
+            x2, y2 = min(x2, self.player.x + radius + 1), min(y2, self.player.y + radius + 1)
+        # `id` i stedet for kortet selv, så cachen ikke holder en gammel etage i live.
+        fov_key = (
+            id(self.game_map),
+            self.player.x,
+            self.player.y,
+            self.game_map.transparency_generation,
+            self.fov_radius,
+            self.fov_algorithm,
+        )
+        if fov_key == self._fov_key:
+            return
+        self._fov_key = fov_key
+
+        visible = compute_fov(
+            self.game_map.tiles['transparent'][x1:x2, y1:y2],
+            (self.player.x - x1, self.player.y - y1),
+            radius=self.fov_radius,
+            algorithm=self.fov_algorithm,
         )
         # Hvis en `tile` er synlig, sæt den til `explored`
-        self.game_map.explored |= self.game_map.visible
+        self.game_map.update_visible(x1, y1, visible)
 
     def render(self, console: Console):
         """Tegner konsolen"""
@@ -76,8 +148,21 @@ class Engine:
 
         render_functions.render_names_at_mouse_location(console, x=21, y=44, engine=self)
 
-    def save_as(self, filename: str) -> None:
-        """Save this Engine instance as a compressed file."""
-        save_data = lzma.compress(pickle.dumps(self))
-        with open(filename, 'wb') as f:
-            f.write(save_data)
+    def save_as(
+            self, filename: str, incremental: bool = False, compression: str = savefile.DEFAULT_COMPRESSION,
+    ) -> None:
+        """Save this Engine instance as a compressed file, see `savefile`.
+
+        With `incremental` only what changed since the last incremental save to the same file is appended.
+        `compression` picks the codec and level, e.g. "zlib:6"; see `savefile.CODECS`.
+        """
+        if not incremental:
+            savefile.save(self, filename, compression)
+            return
+        if (
+                self._journal is None
+                or self._journal.filename != filename
+                or self._journal.compression != compression
+        ):
+            self._journal = savefile.JournalWriter(filename, compression=compression)
+        self._journal.write(savefile.encode_sections(self))
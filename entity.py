@@ -1,10 +1,12 @@
 from __future__ import annotations
 
 import copy
+import itertools
 import math
-from typing import Optional, Tuple, Type, TypeVar, TYPE_CHECKING, Union
+from typing import Iterable, List, Optional, Tuple, Type, TypeVar, TYPE_CHECKING, Union
 
 from render_order import RenderOrder
+from slotted import Slotted
 
 if TYPE_CHECKING:
     from components.ai import BaseAI
@@ -16,10 +18,19 @@ if TYPE_CHECKING:
 
 T = TypeVar('T', bound="Entity")
 
+_uids = itertools.count()
 
-class Entity:
+
+def reserve_uids(next_uid: int) -> None:
+    """Sørg for at nye entities får et `uid` på mindst `next_uid`, fx efter en save er indlæst."""
+    global _uids
+    _uids = itertools.count(max(next_uid, next(_uids)))
+
+
+class Entity(Slotted):
     """ A generic object to represent players, enemies, items, etc.
     """
+    __slots__ = ('parent', 'uid', 'x', 'y', 'char', 'color', 'name', 'blocks_movement', 'render_order')
     parent: Union[GameMap, Inventory]
 
     def __init__(
@@ -43,6 +54,7 @@ class Entity:
             name (str, optional): Navnet på `entity`. Defaults to "<Unnamed>".
             blocks_movement (bool, optional): Beskriver hvis `entity` blokerer movement. Defaults to False.
         """
+        self.uid = self.new_uid()  # Stabilt id, bruges som nøgle i save-filer.
         self.x = x
         self.y = y
         self.char = char
@@ -53,7 +65,7 @@ class Entity:
         if parent:
             # If parent isn't provided now then it will be set later.
             self.parent = parent
-            parent.entities.add(self)
+            parent.add_entity(self)
 
     @property
     def game_map(self):
@@ -71,12 +83,49 @@ class Entity:
             Returns:
                 T: Klon af Entity objektet.
             """
-        clone = copy.deepcopy(self)
+        clone = self.clone()
         clone.x, clone.y = x, y
         clone.parent = game_map
-        game_map.entities.add(clone)
+        game_map.add_entity(clone)
+        return clone
+
+    def spawn_many(self: T, game_map, xs: Iterable[int], ys: Iterable[int]) -> List[T]:
+        """Spawner en kopi af instancen på hver af positionerne (xs[i], ys[i]) i ét kald.
+
+            Args:
+                game_map (GameMap): GameMappet
+                xs (Iterable[int]): X-Koordinater
+                ys (Iterable[int]): Y-Koordinater
+
+            Returns:
+                List[T]: Klonerne, i samme rækkefølge som koordinaterne.
+            """
+        clones = []
+        for x, y in zip(xs, ys):
+            clone = self.clone()
+            clone.x, clone.y = int(x), int(y)
+            clone.parent = game_map
+            clones.append(clone)
+        game_map.add_entities(clones)
+        return clones
+
+    def clone(self: T) -> T:
+        """Returnerer en kopi af denne entity, uden `parent`.
+
+        Hurtigere end `copy.deepcopy`, da subclasses selv ved hvilke komponenter der skal kopieres.
+        """
+        clone = copy.copy(self)
+        clone.uid = self.new_uid()
+        try:
+            del clone.parent
+        except AttributeError:
+            pass
         return clone
 
+    @staticmethod
+    def new_uid() -> int:
+        return next(_uids)
+
     def place(self, x, y, game_map: Optional[GameMap] = None):
         """Placer denne entity på en ny lokation. Handles moving across GameMaps
 
@@ -85,14 +134,16 @@ class Entity:
             y ([type]): [description]
             game_map (Optional[GameMap]): [description]
         """
-        self.x = x
-        self.y = y
         if game_map:
             if hasattr(self, "parent"):  # Hvis attributen ikke er initialiseret
                 if self.parent is self.game_map:
-                    self.game_map.entities.remove(self)
+                    self.game_map.remove_entity(self)
+            self.x = x
+            self.y = y
             self.parent = game_map
-            game_map.entities.add(self)
+            game_map.add_entity(self)
+        else:
+            self._set_location(x, y)
 
     def distance(self, x: int, y: int) -> float:
         """ Returns the distance between the current entity and the given (x, y) coordinate. """
@@ -105,12 +156,25 @@ class Entity:
                 dir_x (int): Direction X-akse
                 dir_y (int): Direction Y-akse
             """
-        self.x += dir_x
-        self.y += dir_y
-    # print(f"{self.x}, {self.y}")
+        self._set_location(self.x + dir_x, self.y + dir_y)
+
+    def sync_columns(self) -> None:
+        """Skriv ændrede attributter (fx `blocks_movement` eller `fighter`) til `GameMap`s kolonner."""
+        if hasattr(self, "parent") and self.parent is self.game_map:
+            self.parent.entity_columns.update(self)
+
+    def _set_location(self, x: int, y: int) -> None:
+        """Sæt koordinaterne, og hold `GameMap`s position-index opdateret."""
+        if hasattr(self, "parent") and self.parent is self.game_map:
+            self.parent.move_entity(self, x, y)
+        else:
+            self.x = x
+            self.y = y
 
 
 class Actor(Entity):
+    __slots__ = ('ai', 'fighter', 'inventory', 'level')
+
     def __init__(
             self,
             *,
@@ -145,6 +209,14 @@ class Actor(Entity):
         self.level = level
         self.level.parent = self
 
+    def clone(self) -> Actor:
+        clone = super().clone()
+        clone.ai = self.ai.clone(clone) if self.ai else None
+        clone.fighter = self.fighter.clone(clone)
+        clone.inventory = self.inventory.clone(clone)
+        clone.level = self.level.clone(clone)
+        return clone
+
     @property
     def is_alive(self) -> bool:
         """ Returnerer True så længe at `Actor` kan `perform` `Action`s. """
@@ -152,6 +224,8 @@ class Actor(Entity):
 
 
 class Item(Entity):
+    __slots__ = ('consumable',)
+
     def __init__(
             self,
             *,
@@ -174,3 +248,8 @@ class Item(Entity):
 
         self.consumable = consumable
         self.consumable.parent = self
+
+    def clone(self) -> Item:
+        clone = super().clone()
+        clone.consumable = self.consumable.clone(clone)
+        return clone
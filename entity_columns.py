@@ -0,0 +1,134 @@
+from __future__ import annotations
+
+from typing import Dict, List, Optional, TYPE_CHECKING
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from entity import Entity
+
+
+class EntityColumns:
+    """ Struct-of-arrays kopi af et `GameMap`s entities, til vektoriserede opslag.
+
+    Hver entity på kortet har en række. Rækker fra fjernede entities genbruges,
+    og en fri række har alle flag sat til False, så den aldrig matcher et opslag.
+    Objekterne er stadig sandheden, kolonnerne opdateres via `GameMap` og `Entity.sync_columns`.
+    `render_order` er `RenderOrder.value`, og 0 for en fri række.
+    """
+    _COLUMNS = ('x', 'y', 'blocks', 'is_actor', 'alive', 'hp', 'max_hp', 'defense', 'power', 'render_order')
+
+    def __init__(self, capacity: int = 64):
+        self.entities: List[Optional[Entity]] = []  # række -> entity
+        self.rows: Dict[Entity, int] = {}  # entity -> række
+        self._free_rows: List[int] = []
+
+        self.x = np.zeros(capacity, dtype=np.int32)
+        self.y = np.zeros(capacity, dtype=np.int32)
+        self.blocks = np.zeros(capacity, dtype=bool)
+        self.is_actor = np.zeros(capacity, dtype=bool)
+        self.alive = np.zeros(capacity, dtype=bool)
+        self.hp = np.zeros(capacity, dtype=np.int32)
+        self.max_hp = np.zeros(capacity, dtype=np.int32)
+        self.defense = np.zeros(capacity, dtype=np.int32)
+        self.power = np.zeros(capacity, dtype=np.int32)
+        self.render_order = np.zeros(capacity, dtype=np.int8)
+
+    def __len__(self) -> int:
+        """ Antal rækker i brug, inklusiv frie rækker imellem. Kolonnerne er kun gyldige op til denne længde. """
+        return len(self.entities)
+
+    def add(self, entity: Entity) -> int:
+        """ Giv `entity` en række (eller genbrug dens nuværende) og skriv dens værdier. """
+        row = self.rows.get(entity)
+        if row is None:
+            if self._free_rows:
+                row = self._free_rows.pop()
+                self.entities[row] = entity
+            else:
+                row = len(self.entities)
+                if row == len(self.x):
+                    self._grow()
+                self.entities.append(entity)
+            self.rows[entity] = row
+        self.update(entity)
+        return row
+
+    def add_many(self, entities: List[Entity]) -> None:
+        """ Giv nye entities hver deres række og skriv alle kolonner på én gang. """
+        if not entities:
+            return
+        rows = []
+        for entity in entities:
+            if self._free_rows:
+                row = self._free_rows.pop()
+                self.entities[row] = entity
+            else:
+                row = len(self.entities)
+                self.entities.append(entity)
+            self.rows[entity] = row
+            rows.append(row)
+        while len(self.entities) > len(self.x):
+            self._grow()
+
+        fighters = [getattr(entity, 'fighter', None) for entity in entities]
+        self.x[rows] = [entity.x for entity in entities]
+        self.y[rows] = [entity.y for entity in entities]
+        self.blocks[rows] = [entity.blocks_movement for entity in entities]
+        self.is_actor[rows] = [fighter is not None for fighter in fighters]
+        self.alive[rows] = [bool(getattr(entity, 'ai', None)) for entity in entities]
+        self.hp[rows] = [fighter.hp if fighter else 0 for fighter in fighters]
+        self.max_hp[rows] = [fighter.max_hp if fighter else 0 for fighter in fighters]
+        self.defense[rows] = [fighter.defense if fighter else 0 for fighter in fighters]
+        self.power[rows] = [fighter.power if fighter else 0 for fighter in fighters]
+        self.render_order[rows] = [entity.render_order.value for entity in entities]
+
+    def remove(self, entity: Entity) -> None:
+        row = self.rows.pop(entity)
+        self.entities[row] = None
+        self.blocks[row] = self.is_actor[row] = self.alive[row] = False
+        self.render_order[row] = 0
+        self._free_rows.append(row)
+
+    def move(self, entity: Entity) -> None:
+        row = self.rows[entity]
+        self.x[row] = entity.x
+        self.y[row] = entity.y
+
+    def update(self, entity: Entity) -> None:
+        """ Skriv alle kolonner for `entity` ud fra objektets nuværende attributter. """
+        row = self.rows[entity]
+        self.x[row] = entity.x
+        self.y[row] = entity.y
+        self.blocks[row] = entity.blocks_movement
+        self.render_order[row] = entity.render_order.value
+        fighter = getattr(entity, 'fighter', None)
+        self.is_actor[row] = fighter is not None
+        self.alive[row] = bool(getattr(entity, 'ai', None))
+        if fighter is not None:
+            self.hp[row] = fighter.hp
+            self.max_hp[row] = fighter.max_hp
+            self.defense[row] = fighter.defense
+            self.power[row] = fighter.power
+
+    def alive_actor_rows(self) -> np.ndarray:
+        """ Rækkerne for alle levende `Actor`s. """
+        size = len(self.entities)
+        return np.flatnonzero(self.is_actor[:size] & self.alive[:size])
+
+    def blocking_rows(self) -> np.ndarray:
+        """ Rækkerne for alle entities som blokerer bevægelse. """
+        return np.flatnonzero(self.blocks[:len(self.entities)])
+
+    def rows_in_rect(self, x1: int, y1: int, x2: int, y2: int) -> np.ndarray:
+        """ Rækkerne for alle entities indenfor rektanglet [x1, x2) x [y1, y2). """
+        size = len(self.entities)
+        xs, ys = self.x[:size], self.y[:size]
+        return np.flatnonzero((self.render_order[:size] > 0) & (x1 <= xs) & (xs < x2) & (y1 <= ys) & (ys < y2))
+
+    def _grow(self) -> None:
+        for name in self._COLUMNS:
+            column = getattr(self, name)
+            grown = np.zeros(len(column) * 2, dtype=column.dtype)
+            grown[:len(column)] = column
+            setattr(self, name, grown)
@@ -0,0 +1,165 @@
+"""Generer og mål mange etager offline, fordelt over en `multiprocessing` pool.
+
+Køres fra roden af repoet:
+
+    python floor_batch.py --floors 5000 --seed 42 --stats floors.jsonl
+    python floor_batch.py --floors 200 --export floors/ --map-size 200x120
+
+Etage N genereres med samme RNG som `GameWorld.rng("floor", N)`, så med samme seed og indstillinger
+er etagerne de samme som i et spil. Statistik for hver etage skrives som en JSON-linje, så snart den er færdig.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+from typing import Any, Dict, List, Optional, TextIO
+
+import numpy as np
+import tcod
+
+from game_map import GameMap
+from prefetch import generate_detached_floor
+from procgen import RectangularRoom
+import rng as rng_streams
+
+# Samme indstillinger som `setup_game.new_game`.
+DEFAULT_SETTINGS: Dict[str, Any] = dict(
+    max_rooms=30,
+    room_min_size=6,
+    room_max_size=10,
+    map_width=80,
+    map_height=43,
+    max_monsters_per_room=2,
+    max_items_per_room=2,
+)
+
+# Sættes i hver arbejdsproces af `_init_worker`.
+_settings: Dict[str, Any] = {}
+_seed = 0
+_export: Optional[str] = None
+
+
+def floor_stats(game_map: GameMap, rooms: List[RectangularRoom]) -> Dict[str, Any]:
+    """Returnerer rum, gulvandel, monster- og item-tæthed, og om trappen kan nås fra spillerens start."""
+    player = game_map.engine.player
+    walkable = game_map.tiles["walkable"]
+    walkable_tiles = int(walkable.sum())
+    monsters = sum(1 for actor in game_map.actors if actor is not player)
+    items = sum(1 for _ in game_map.items)
+
+    distance = tcod.path.maxarray(walkable.shape, dtype=np.int32, order="F")
+    distance[player.x, player.y] = 0
+    tcod.path.dijkstra2d(distance, walkable.astype(np.int8), 2, 3)
+    stairs_distance = int(distance[game_map.downstairs_location])
+    stairs_reachable = stairs_distance != np.iinfo(np.int32).max
+
+    return {
+        "rooms": len(rooms),
+        "walkable_ratio": walkable_tiles / walkable.size,
+        "monsters": monsters,
+        "items": items,
+        "monsters_per_100_tiles": monsters * 100 / walkable_tiles,
+        "items_per_100_tiles": items * 100 / walkable_tiles,
+        "stairs_reachable": bool(stairs_reachable),
+        "stairs_distance": stairs_distance if stairs_reachable else None,
+    }
+
+
+def export_floor(filename: str, game_map: GameMap) -> None:
+    """Gem etagens tiles, trappe og entities i en .npz fil."""
+    player = game_map.engine.player
+    monsters = [actor for actor in game_map.actors if actor is not player]
+    items = list(game_map.items)
+    np.savez_compressed(
+        filename,
+        tiles=game_map.tiles,
+        player=np.array((player.x, player.y), dtype=np.int32),
+        downstairs=np.array(game_map.downstairs_location, dtype=np.int32),
+        monsters=np.array([(e.x, e.y) for e in monsters], dtype=np.int32).reshape(-1, 2),
+        monster_names=np.array([e.name for e in monsters], dtype=str),
+        items=np.array([(e.x, e.y) for e in items], dtype=np.int32).reshape(-1, 2),
+        item_names=np.array([e.name for e in items], dtype=str),
+    )
+
+
+def _init_worker(settings: Dict[str, Any], seed: int, export: Optional[str]) -> None:
+    global _settings, _seed, _export
+    _settings, _seed, _export = settings, seed, export
+
+
+def generate_floor(floor: int) -> Dict[str, Any]:
+    """Kører i en arbejdsproces: generer etage `floor` og returner dens statistik."""
+    rooms: List[RectangularRoom] = []
+    start = time.perf_counter()
+    game_map = generate_detached_floor(dict(_settings, rng=rng_streams.derive(_seed, "floor", floor), rooms=rooms))
+    seconds = time.perf_counter() - start
+    if _export:
+        export_floor(os.path.join(_export, f"floor-{floor:05d}.npz"), game_map)
+    return {"floor": floor, "seconds": seconds, **floor_stats(game_map, rooms)}
+
+
+def run(
+        floors: int,
+        seed: int,
+        settings: Dict[str, Any],
+        processes: int,
+        out: TextIO,
+        export: Optional[str] = None,
+) -> List[Dict[str, Any]]:
+    """Generer etage 1 til `floors` i `processes` processer, og skriv en JSON-linje til `out` for hver."""
+    if export:
+        os.makedirs(export, exist_ok=True)
+    results = []
+    # Mange små etager pr. opgave, så overhead for at sende dem mellem processerne ikke dominerer.
+    chunksize = max(1, min(64, floors // (processes * 8)))
+    with multiprocessing.Pool(processes, initializer=_init_worker, initargs=(settings, seed, export)) as pool:
+        for stats in pool.imap_unordered(generate_floor, range(1, floors + 1), chunksize):
+            out.write(json.dumps(stats) + "\n")
+            results.append(stats)
+    return results
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--floors", type=int, default=1000, help="Antal etager.")
+    parser.add_argument("--seed", type=int, default=0, help="Verdenens seed, som i `GameWorld`.")
+    parser.add_argument("--map-size", default="80x43", help="Kortstørrelse som BREDDExHØJDE.")
+    parser.add_argument("--max-rooms", type=int, default=DEFAULT_SETTINGS["max_rooms"])
+    parser.add_argument("-j", "--processes", type=int, default=os.cpu_count() or 1, help="Antal arbejdsprocesser.")
+    parser.add_argument("--stats", default="-", help="Fil til statistik som JSON-linjer; - er stdout.")
+    parser.add_argument("--export", default=None, help="Gem hver etage som floor-NNNNN.npz i denne mappe.")
+    args = parser.parse_args(argv)
+    if args.floors < 1:
+        parser.error("--floors must be at least 1.")
+    map_width, map_height = (int(size) for size in args.map_size.lower().split("x"))
+    settings = dict(DEFAULT_SETTINGS, map_width=map_width, map_height=map_height, max_rooms=args.max_rooms)
+
+    out = sys.stdout if args.stats == "-" else open(args.stats, "w")
+    try:
+        start = time.perf_counter()
+        results = run(args.floors, args.seed, settings, args.processes, out, args.export)
+        elapsed = time.perf_counter() - start
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    if not results:
+        print(f"No floors generated in {elapsed:.2f} s.", file=sys.stderr)
+        return
+    unreachable = sum(1 for stats in results if not stats["stairs_reachable"])
+    rate = len(results) / elapsed
+    print(
+        f"{len(results)} floors in {elapsed:.2f} s: {rate:.0f} floors/s, "
+        f"{rate / args.processes:.0f} floors/s per core ({args.processes} processes); "
+        f"{unreachable} with unreachable stairs, "
+        f"mean {np.mean([stats['rooms'] for stats in results]):.1f} rooms",
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    main()
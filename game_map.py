@@ -1,11 +1,20 @@
 from __future__ import annotations
 
+from concurrent.futures import Future
+import os
+import random
+import traceback
+
 import numpy as np
 from tcod.console import Console
 
-from typing import Iterable, Iterator, Optional, TYPE_CHECKING
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple, TYPE_CHECKING
 
 from entity import Actor, Item
+from entity_columns import EntityColumns
+import instrumentation
+from render_order import RenderOrder
+import rng as rng_streams
 import tile_types
 
 if TYPE_CHECKING:
@@ -14,11 +23,36 @@ if TYPE_CHECKING:
 
 
 class GameMap:
+    # Tælles op når `tiles['transparent']` ændres, så `Engine.update_fov` ved at dens cache er forældet.
+    transparency_generation: int = 0
+    # Største udsnit af kortet som tegnes på skærmen, se `view`.
+    view_width: int = 80
+    view_height: int = 43
+    # Den færdige grafik for `view`, som `render` genbruger. Se `mark_dirty`.
+    _layer_cache: Optional[np.ndarray] = None
+    _layer_key: Optional[Tuple[Tuple[int, int, int, int], int]] = None
+    _dirty_area: Optional[Tuple[int, int, int, int]] = None
+    # Området som `update_visible` sidst satte. None når det ikke vides, fx efter en save, så hele `visible` ryddes.
+    _visible_area: Optional[Tuple[int, int, int, int]] = None
+
     def __init__(self, engine, width, height, entities: Iterable[Entity] = ()):
         self.engine = engine
         self.width = width
         self.height = height
-        self.entities = set(entities)
+        self.entities: Set[Entity] = set()
+        # Position-index så opslag på en `tile` ikke skal scanne alle entities.
+        self._entity_locations: Dict[Entity, Tuple[int, int]] = {}
+        self._location_index: Dict[Tuple[int, int], List[Entity]] = {}
+        # Positioner, flag og fighter-stats som NumPy kolonner, til vektoriserede opslag.
+        self.entity_columns = EntityColumns()
+        for entity in entities:
+            self.add_entity(entity)
+        self._create_layers(width, height)
+
+        self.downstairs_location = (0, 0)
+
+    def _create_layers(self, width: int, height: int) -> None:
+        """Opret `tiles`, `visible` og `explored`. Overskrives af `ChunkedGameMap`."""
         # Fylder hele mappet op med vægge.
         self.tiles = np.full((width, height), fill_value=tile_types.wall, order='F')
 
@@ -29,46 +63,242 @@ class GameMap:
             (width, height), fill_value=False, order="F"
         )  # Tiles spilleren har udforsket
 
-        self.downstairs_location = (0, 0)
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for name in ('_layer_cache', '_layer_key', '_dirty_area'):
+            state.pop(name, None)
+        return state
 
     @property
     def game_map(self) -> GameMap:
         return self
 
+    @property
+    def view(self) -> Tuple[int, int, int, int]:
+        """Den del af kortet som tegnes, som (x1, y1, x2, y2). Kortets (x1, y1) tegnes i konsolens (0, 0).
+
+        Hele kortet hvis det kan være på skærmen, ellers `view_width` x `view_height` tiles centreret om spilleren.
+        """
+        if self.width <= self.view_width and self.height <= self.view_height:
+            return 0, 0, self.width, self.height
+        width, height = min(self.view_width, self.width), min(self.view_height, self.height)
+        player = self.engine.player
+        x1 = min(max(player.x - width // 2, 0), self.width - width)
+        y1 = min(max(player.y - height // 2, 0), self.height - height)
+        return x1, y1, x1 + width, y1 + height
+
+    def get_active_area(self, x: int, y: int) -> Tuple[int, int, int, int]:
+        """Området omkring (X, Y) som FOV og pathfinding regner på, som (x1, y1, x2, y2) med x2 og y2 eksklusiv."""
+        return 0, 0, self.width, self.height
+
     @property
     def actors(self) -> Iterator[Actor]:
         """ Iterate igennem kortet for at finde "levende" `Actor`s """
-        yield from (
-            entity
-            for entity in self.entities
-            if isinstance(entity, Actor) and entity.is_alive
-        )
+        columns = self.entity_columns
+        for row in columns.alive_actor_rows().tolist():
+            entity = columns.entities[row]
+            # Tjek igen, hvis en `Actor` er død eller fjernet mens vi itererer.
+            if entity is not None and entity.is_alive:
+                yield entity
 
     @property
     def items(self) -> Iterator[Item]:
+        instrumentation.count("entities_scanned", len(self.entities))
         yield from (
             entity
             for entity in self.entities
             if isinstance(entity, Item)
         )
 
+    def add_entity(self, entity: Entity) -> None:
+        """Tilføj en `entity` til kortet og dens position til indexet.
+
+        Hvis `entity` allerede er på kortet, bliver den blot re-indexeret.
+        """
+        if entity in self.entities:
+            self._unindex(entity)
+        self.entities.add(entity)
+        self._index(entity)
+        self.entity_columns.add(entity)
+
+    def add_entities(self, entities: Iterable[Entity]) -> None:
+        """Tilføj mange nye entities på én gang, fx fra `Entity.spawn_many`."""
+        entities = [entity for entity in entities if entity not in self.entities]
+        self.entities.update(entities)
+        for entity in entities:
+            self._index(entity)
+        self.entity_columns.add_many(entities)
+
+    def remove_entity(self, entity: Entity) -> None:
+        """Fjern en `entity` fra kortet og fra position-indexet."""
+        self.entities.remove(entity)
+        self._unindex(entity)
+        self.entity_columns.remove(entity)
+
+    def move_entity(self, entity: Entity, x: int, y: int) -> None:
+        """Flyt en `entity` på kortet til (X, Y) og opdater position-indexet."""
+        self._unindex(entity)
+        entity.x, entity.y = x, y
+        self._index(entity)
+        self.entity_columns.move(entity)
+
+    def rebuild_index(self) -> None:
+        """Genopbyg position-indexet og kolonnerne ud fra `entities`, fx for saves lavet før de fandtes."""
+        self._entity_locations = {}
+        self._location_index = {}
+        self.entity_columns = EntityColumns()
+        for entity in self.entities:
+            self._index(entity)
+            self.entity_columns.add(entity)
+
+    def _index(self, entity: Entity) -> None:
+        location = entity.x, entity.y
+        self._entity_locations[entity] = location
+        self._location_index.setdefault(location, []).append(entity)
+
+    def _unindex(self, entity: Entity) -> None:
+        location = self._entity_locations.pop(entity)
+        entities_at_location = self._location_index[location]
+        entities_at_location.remove(entity)
+        if not entities_at_location:
+            del self._location_index[location]
+
+    def get_entities_at_location(self, x: int, y: int) -> List[Entity]:
+        """ Returnerer alle entities på (X, Y), uden at scanne hele kortet. """
+        return list(self._location_index.get((x, y), ()))
+
+    def get_entities_in_rect(self, x1: int, y1: int, x2: int, y2: int) -> Iterator[Entity]:
+        """ Returnerer alle entities indenfor rektanglet [x1, x2) x [y1, y2).
+
+        Args:
+            x1 (int): Venstre X-koordinat (inklusiv)
+            y1 (int): Øverste Y-koordinat (inklusiv)
+            x2 (int): Højre X-koordinat (eksklusiv)
+            y2 (int): Nederste Y-koordinat (eksklusiv)
+        """
+        area = max(0, x2 - x1) * max(0, y2 - y1)
+        if area <= len(self._location_index):
+            # Rektanglet er lille, så vi slår hver `tile` op.
+            for x in range(x1, x2):
+                for y in range(y1, y2):
+                    yield from self._location_index.get((x, y), ())
+        else:
+            # Der er færre optagede `tiles` end der er i rektanglet.
+            for (x, y), entities_at_location in self._location_index.items():
+                if x1 <= x < x2 and y1 <= y < y2:
+                    yield from entities_at_location
+
+    def get_entities_in_radius(self, x: int, y: int, radius: float) -> Iterator[Entity]:
+        """ Returnerer alle entities hvis afstand til (X, Y) er højst `radius`. """
+        reach = int(radius)
+        for entity in self.get_entities_in_rect(x - reach, y - reach, x + reach + 1, y + reach + 1):
+            if (entity.x - x) ** 2 + (entity.y - y) ** 2 <= radius ** 2:
+                yield entity
+
+    def get_actors_in_radius(self, x: int, y: int, radius: float) -> List[Actor]:
+        """ Returnerer alle levende `Actor`s hvis afstand til (X, Y) er højst `radius`. """
+        columns = self.entity_columns
+        rows = columns.alive_actor_rows()
+        dx = columns.x[rows] - x
+        dy = columns.y[rows] - y
+        return [columns.entities[row] for row in rows[dx * dx + dy * dy <= radius * radius].tolist()]
+
+    def get_nearest_visible_actor(
+            self, x: int, y: int, max_distance: float, exclude: Optional[Actor] = None,
+    ) -> Optional[Actor]:
+        """ Returnerer den nærmeste synlige, levende `Actor` som er tættere på (X, Y) end `max_distance`. """
+        columns = self.entity_columns
+        rows = columns.alive_actor_rows()
+        if exclude is not None and exclude in columns.rows:
+            rows = rows[rows != columns.rows[exclude]]
+        xs, ys = columns.x[rows], columns.y[rows]
+        distance = np.hypot(xs - x, ys - y)
+        candidates = self.visible[xs, ys] & (distance < max_distance)
+        if not candidates.any():
+            return None
+        rows, distance = rows[candidates], distance[candidates]
+        return columns.entities[int(rows[np.argmin(distance)])]
+
     def get_actor_at_location(self, x: int, y: int) -> Optional[Actor]:
-        for actor in self.actors:
-            if actor.x == x and actor.y == y:
-                return actor
+        for entity in self._location_index.get((x, y), ()):
+            if isinstance(entity, Actor) and entity.is_alive:
+                return entity
         return None
 
     # NOTE: Might not be needed
     def get_blocking_entity_at_location(self, location_x: int, location_y: int):
-        for entity in self.entities:
-            if (
-                    entity.blocks_movement
-                    and entity.x == location_x
-                    and entity.y == location_y
-            ):
+        for entity in self._location_index.get((location_x, location_y), ()):
+            if entity.blocks_movement:
                 return entity
         return None
 
+    def invalidate_transparency(self) -> None:
+        """Kaldes efter `tiles` er ændret på en måde som kan påvirke FOV. `render` tegner så hele `view` igen."""
+        self.transparency_generation += 1
+
+    def mark_dirty(self, x1: int, y1: int, x2: int, y2: int) -> None:
+        """Kaldes efter `visible`, `explored` eller `tiles` er ændret i [x1, x2) x [y1, y2), så `render` tegner det igen."""
+        if self._dirty_area is not None:
+            old_x1, old_y1, old_x2, old_y2 = self._dirty_area
+            x1, y1, x2, y2 = min(x1, old_x1), min(y1, old_y1), max(x2, old_x2), max(y2, old_y2)
+        self._dirty_area = x1, y1, x2, y2
+
+    def update_visible(self, x1: int, y1: int, visible: np.ndarray) -> None:
+        """Sæt `visible` til et FOV beregnet for området som starter i (x1, y1), og marker det som `explored`.
+
+        Alt udenfor området bliver usynligt. Kun området fra sidst og det nye ryddes, skrives og markeres
+        med `mark_dirty`, så en tur kun rører felterne omkring spilleren.
+        """
+        x2, y2 = x1 + visible.shape[0], y1 + visible.shape[1]
+        if self._visible_area is None:
+            self.visible[:] = False
+            self.mark_dirty(0, 0, self.width, self.height)
+        else:
+            old_x1, old_y1, old_x2, old_y2 = self._visible_area
+            self.visible[old_x1:old_x2, old_y1:old_y2] = False
+            self.mark_dirty(old_x1, old_y1, old_x2, old_y2)
+        if visible.shape == self.visible.shape:
+            self.visible[:] = visible
+            # `self.visible` i stedet for `visible`, fordi det har samme memory layout som `explored`.
+            self.explored |= self.visible
+        else:
+            self.visible[x1:x2, y1:y2] = visible
+            self.explored[x1:x2, y1:y2] |= self.visible[x1:x2, y1:y2]
+        self.mark_dirty(x1, y1, x2, y2)
+        self._visible_area = x1, y1, x2, y2
+
+    def _compose_layer(self, out: np.ndarray, x1: int, y1: int, x2: int, y2: int) -> None:
+        """Sammensæt grafikken for [x1, x2) x [y1, y2) i `out`: lys hvis `visible`, mørk hvis `explored`, ellers SHROUD.
+
+        Med `np.copyto` i stedet for `np.select`, så der ikke laves midlertidige arrays på størrelse med området.
+        """
+        tiles = self.tiles[x1:x2, y1:y2]
+        out[...] = tile_types.SHROUD
+        np.copyto(out, tiles['dark'], where=self.explored[x1:x2, y1:y2])
+        np.copyto(out, tiles['light'], where=self.visible[x1:x2, y1:y2])
+
+    def get_movement_cost(self, area: Optional[Tuple[int, int, int, int]] = None) -> np.ndarray:
+        """Returnerer et cost-array til pathfinding, hvor 0 er ufremkommeligt.
+
+        Med `area` (x1, y1, x2, y2) dækker arrayet kun det område, og dets [0, 0] er kortets (x1, y1).
+        """
+        x1, y1, x2, y2 = area or (0, 0, self.width, self.height)
+        # Kopier den 'walkable' list.
+        # Note `cost` fordi vi ser hvor meget tid det koster at komme over til målet.
+        cost = np.array(self.tiles['walkable'][x1:x2, y1:y2], dtype=np.int8)
+
+        # Add to the cost of a blocked position, unless the cost is zero (blocking)
+        # A lower number means more enemies will crowd behind each other in hallways.
+        # A higher number means enemies will take longer paths in order to surround the player
+        # This encourages the entity to move around that area, since the entity will try to go the path with the smallest cost
+        columns = self.entity_columns
+        rows = columns.blocking_rows()
+        xs, ys = columns.x[rows] - x1, columns.y[rows] - y1
+        inside = (0 <= xs) & (xs < cost.shape[0]) & (0 <= ys) & (ys < cost.shape[1])
+        xs, ys = xs[inside], ys[inside]
+        np.add.at(cost, (xs, ys), 10 * cost[xs, ys])
+        return cost
+
     def in_bounds(self, x, y) -> bool:
         """Returner True hvis (X, Y) er inden i mappet.
 
@@ -85,32 +315,66 @@ class GameMap:
          Hvis en `tile` er i det `visible` array, så bliver det tegnet med lyse farver, & vice versa.
          Default værdien er `SHROUD`
 
-         np.select allows us to conditionally draw the tiles we want, based on what’s specified in condlist. Since we’re passing [self.visible, self.explored], it will check if the tile being drawn is either visible, then explored. If it’s visible, it uses the first value in choicelist, in this case, self.tiles["light"]. If it’s not visible, but explored, then we draw self.tiles["dark"]. If neither is true, we use the default argument, which is just the SHROUD we defined earlier.
+         Grafikken for `view` gemmes mellem frames, og kun det område `mark_dirty` har markeret sammensættes igen,
+         så frames hvor kun musen eller en menu har ændret sig, blot kopierer den til konsollen.
+         Hele `view` sammensættes igen når det flytter sig, eller efter `invalidate_transparency`.
+
+         Kun `view` tegnes, så (x1, y1) i `view` havner i konsolens (0, 0).
 
          Args:
             console (Console): Main console
         """
-        console.tiles_rgb[0: self.width, 0: self.height] = np.select(
-            condlist=[self.visible, self.explored],
-            choicelist=[self.tiles['light'], self.tiles['dark']],
-            default=tile_types.SHROUD,
-        )
-
-        entities_sorted_for_rendering = sorted(
-            self.entities, key=lambda x: x.render_order.value
-        )
+        x1, y1, x2, y2 = view = self.view
+        key = (view, self.transparency_generation)
+        if self._layer_key != key:
+            if self._layer_cache is None or self._layer_cache.shape != (x2 - x1, y2 - y1):
+                self._layer_cache = np.empty((x2 - x1, y2 - y1), dtype=tile_types.graphic_dt, order="F")
+            self._compose_layer(self._layer_cache, *view)
+            self._layer_key = key
+        elif self._dirty_area is not None:
+            dirty_x1, dirty_y1, dirty_x2, dirty_y2 = self._dirty_area
+            dirty_x1, dirty_y1 = max(dirty_x1, x1), max(dirty_y1, y1)
+            dirty_x2, dirty_y2 = min(dirty_x2, x2), min(dirty_y2, y2)
+            if dirty_x1 < dirty_x2 and dirty_y1 < dirty_y2:
+                self._compose_layer(
+                    self._layer_cache[dirty_x1 - x1:dirty_x2 - x1, dirty_y1 - y1:dirty_y2 - y1],
+                    dirty_x1, dirty_y1, dirty_x2, dirty_y2,
+                )
+        self._dirty_area = None
+        console.tiles_rgb[0: x2 - x1, 0: y2 - y1] = self._layer_cache
 
-        for entity in entities_sorted_for_rendering:
-            # Tegn kun entities som er inden i FOV
-            if self.visible[entity.x, entity.y]:
-                console.print(x=entity.x, y=entity.y, string=entity.char, fg=entity.color)
+        # Tegn kun entities som er inden i FOV, fundet med én maske over `entity_columns` i stedet for en løkke.
+        columns = self.entity_columns
+        rows = columns.rows_in_rect(x1, y1, x2, y2)
+        rows = rows[self.visible[x1:x2, y1:y2][columns.x[rows] - x1, columns.y[rows] - y1]]
+        instrumentation.count("entities_scanned", len(rows))
+        render_orders = columns.render_order[rows]
+        # En spand pr. `RenderOrder`, så lig tegnes først og actors sidst, uden at sortere.
+        for render_order in RenderOrder:
+            for row in rows[render_orders == render_order.value]:
+                entity = columns.entities[row]
+                console.print(x=entity.x - x1, y=entity.y - y1, string=entity.char, fg=entity.color)
 
 
 class GameWorld:
     """
     Holds teh settings for the GameMap, and generates new maps when movind down the stairs.
+
+    Med `chunk_size` bliver hver etage et `ChunkedGameMap`, som genereres efterhånden som spilleren udforsker den.
+    Ellers, med `map_directory`, bliver hver etage et `MappedGameMap` med sine lag i en undermappe.
+    Med `prefetch` genereres den næste etage i en baggrundsproces, mens spilleren er på den nuværende.
+
+    Al tilfældighed i etager og AI kommer fra `rng`, som kun afhænger af `seed`, så en etage
+    kan genskabes ud fra (seed, etage) uanset hvilken proces der genererer den.
     """
 
+    # Klasse-defaults, så saves fra før chunked og memory-mapped maps og seeds stadig kan indlæses.
+    chunk_size: Optional[int] = None
+    map_directory: Optional[str] = None
+    prefetch: bool = False
+    seed: int = 0
+    _next_floor: Optional[Tuple[int, Future]] = None
+
     def __init__(
             self,
             *,
@@ -123,6 +387,10 @@ class GameWorld:
             max_monsters_per_room: int,
             max_items_per_room: int,
             current_floor: int = 0,
+            chunk_size: Optional[int] = None,
+            map_directory: Optional[str] = None,
+            prefetch: bool = False,
+            seed: Optional[int] = None,
     ):
         self.engine = engine
         self.map_width = map_width
@@ -133,13 +401,63 @@ class GameWorld:
         self.max_monsters_per_room = max_monsters_per_room
         self.max_items_per_room = max_items_per_room
         self.current_floor = current_floor
+        self.chunk_size = chunk_size
+        self.map_directory = map_directory
+        self.prefetch = prefetch
+        self.seed = random.getrandbits(32) if seed is None else seed
+        self._next_floor = None  # (etage, Future) for etagen som genereres i baggrunden.
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop('_next_floor', None)
+        return state
+
+    def rng(self, *stream) -> random.Random:
+        """Returnerer en ny RNG for `stream`, fx ("floor", 3), som kun afhænger af `seed` og `stream`."""
+        return rng_streams.derive(self.seed, *stream)
 
     def generate_floor(self) -> None:
-        from procgen import generate_dungeon
+        from procgen import generate_chunked_dungeon, generate_dungeon
 
         self.current_floor += 1
 
-        self.engine.game_map = generate_dungeon(
+        if self.chunk_size:
+            self.engine.game_map = generate_chunked_dungeon(
+                room_min_size=self.room_min_size,
+                room_max_size=self.room_max_size,
+                map_width=self.map_width,
+                map_height=self.map_height,
+                max_monsters_per_room=self.max_monsters_per_room,
+                max_items_per_room=self.max_items_per_room,
+                engine=self.engine,
+                chunk_size=self.chunk_size,
+                seed=self.rng("floor", self.current_floor).getrandbits(32),
+            )
+            return
+
+        game_map = self._take_prefetched_floor()
+        if game_map is None:
+            # Baggrundsprocessen er ikke færdig (eller slået fra), så generer etagen her.
+            game_map = generate_dungeon(engine=self.engine, **self._floor_settings(self.current_floor))
+        self.engine.game_map = game_map
+        self.prefetch_next_floor()
+
+    def prefetch_next_floor(self) -> None:
+        """Begynd at generere etagen under den nuværende i baggrundsprocessen, hvis `prefetch` er slået til."""
+        if not self.prefetch or self.chunk_size:  # Chunked etager genereres alligevel først når de bruges.
+            return
+        import prefetch
+
+        floor = self.current_floor + 1
+        settings = self._floor_settings(floor, suffix="-prefetch")
+        try:
+            self._next_floor = floor, prefetch.submit_floor(settings)
+        except Exception:  # Så genereres etagen bare når spilleren går ned.
+            traceback.print_exc()
+
+    def _floor_settings(self, floor: int, suffix: str = "") -> Dict[str, Any]:
+        """Argumenterne til `procgen.generate_dungeon`, undtagen `engine`."""
+        return dict(
             max_rooms=self.max_rooms,
             room_min_size=self.room_min_size,
             room_max_size=self.room_max_size,
@@ -147,5 +465,30 @@ class GameWorld:
             map_height=self.map_height,
             max_monsters_per_room=self.max_monsters_per_room,
             max_items_per_room=self.max_items_per_room,
-            engine=self.engine,
+            # Baggrundsprocessen får sin egen mappe, så den ikke skriver i de filer som bruges hvis den ikke når det.
+            directory=os.path.join(self.map_directory, f"floor-{floor}{suffix}") if self.map_directory else None,
+            rng=self.rng("floor", floor),
         )
+
+    def _take_prefetched_floor(self) -> Optional[GameMap]:
+        """Returnerer den etage baggrundsprocessen har genereret, med den rigtige spiller, hvis den er færdig."""
+        pending, self._next_floor = self._next_floor, None
+        if pending is None:
+            return None
+        floor, future = pending
+        if floor != self.current_floor or not future.done():
+            future.cancel()
+            return None
+        try:
+            game_map = future.result()
+        except Exception:
+            traceback.print_exc()
+            return None
+
+        stand_in = game_map.engine.player
+        game_map.remove_entity(stand_in)
+        game_map.engine = self.engine
+        for entity in game_map.entities:
+            entity.uid = entity.new_uid()  # Baggrundsprocessens uids kan allerede være i brug her.
+        self.engine.player.place(stand_in.x, stand_in.y, game_map)
+        return game_map
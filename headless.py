@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""Run the game without a window or tileset, driven by a player policy.
+
+Used for load-testing turn throughput on machines without a display:
+
+    python headless.py --turns 10000 --policy bot --render
+"""
+from __future__ import annotations
+
+import argparse
+import random
+import time
+from typing import Callable, Iterable, Iterator, Optional, Tuple
+
+import numpy as np
+import tcod.path
+from tcod.console import Console
+
+from actions import Action, BumpAction, MeleeAction, PickUpAction, TakeStairsAction, WaitAction
+from engine import Engine
+from entity import Item
+import input_handlers
+import instrumentation
+import setup_game
+
+Policy = Callable[[Engine], Optional[Action]]
+"""A player policy returns the next action for the player, or None to skip the turn."""
+
+DIRECTIONS = [(-1, -1), (0, -1), (1, -1), (-1, 0), (1, 0), (-1, 1), (0, 1), (1, 1)]
+
+
+def random_walk_policy(engine: Engine) -> Action:
+    """Bump in a random direction every turn."""
+    return BumpAction(engine.player, *random.choice(DIRECTIONS))
+
+
+class ScriptedPolicy:
+    """Play back a fixed sequence of moves, then wait forever.
+
+    Each step is either a (dir_x, dir_y) pair or a callable taking the Engine and returning an Action.
+    """
+
+    def __init__(self, steps: Iterable[object]):
+        self.steps: Iterator[object] = iter(steps)
+
+    def __call__(self, engine: Engine) -> Action:
+        step = next(self.steps, None)
+        if step is None:
+            return WaitAction(engine.player)
+        if callable(step):
+            return step(engine)
+        dir_x, dir_y = step
+        return BumpAction(engine.player, dir_x, dir_y)
+
+
+def bot_policy(engine: Engine) -> Action:
+    """Fight the nearest visible enemy, otherwise pick up items and head for the stairs."""
+    player = engine.player
+    game_map = engine.game_map
+
+    targets = [
+        actor for actor in game_map.actors
+        if actor is not player and game_map.visible[actor.x, actor.y]
+    ]
+    if targets:
+        target = min(targets, key=lambda actor: player.distance(actor.x, actor.y))
+        dir_x, dir_y = target.x - player.x, target.y - player.y
+        if max(abs(dir_x), abs(dir_y)) <= 1:
+            return MeleeAction(player, dir_x, dir_y)
+        destination = target.x, target.y
+    else:
+        if any(isinstance(entity, Item) for entity in game_map.get_entities_at_location(player.x, player.y)):
+            if len(player.inventory.items) < player.inventory.capacity:
+                return PickUpAction(player)
+        destination = game_map.downstairs_location
+        if (player.x, player.y) == destination:
+            return TakeStairsAction(player)
+
+    step = _first_step_towards(engine, destination)
+    if step is None:
+        return random_walk_policy(engine)
+    return BumpAction(player, step[0] - player.x, step[1] - player.y)
+
+
+def _first_step_towards(engine: Engine, destination: Tuple[int, int]) -> Optional[Tuple[int, int]]:
+    player = engine.player
+    x1, y1, x2, y2 = engine.game_map.get_active_area(player.x, player.y)
+    graph = tcod.path.SimpleGraph(cost=engine.game_map.get_movement_cost((x1, y1, x2, y2)), cardinal=2, diagonal=3)
+    pathfinder = tcod.path.Pathfinder(graph)
+    pathfinder.add_root((player.x - x1, player.y - y1))
+    dest_x, dest_y = destination
+    if x1 <= dest_x < x2 and y1 <= dest_y < y2:
+        goal = dest_x - x1, dest_y - y1
+    else:
+        # Målet er udenfor det aktive område på et chunked kort; gå mod det nærmeste sted vi kan nå.
+        pathfinder.resolve()
+        distance = pathfinder.distance
+        xs, ys = np.nonzero(distance != np.iinfo(distance.dtype).max)
+        nearest = np.argmin((xs + x1 - dest_x) ** 2 + (ys + y1 - dest_y) ** 2)
+        goal = int(xs[nearest]), int(ys[nearest])
+    path = pathfinder.path_to(goal)[1:].tolist()
+    if not path:
+        return None
+    return path[0][0] + x1, path[0][1] + y1
+
+
+POLICIES = {
+    "random": random_walk_policy,
+    "bot": bot_policy,
+}
+
+
+def simulate(
+        turns: int,
+        policy: Policy = random_walk_policy,
+        *,
+        engine: Optional[Engine] = None,
+        console: Optional[Console] = None,
+) -> Tuple[Engine, int]:
+    """Play up to `turns` player actions, or until the player dies.
+
+    Returns the Engine and the number of player actions that were played.
+
+    Turns are handled exactly like `EventHandler.handle_action` does it in the real game.
+    If `console` is given every turn is also rendered into it.
+    """
+    if engine is None:
+        engine = setup_game.new_game()
+    handler = input_handlers.EventHandler(engine)
+
+    turns_played = 0
+    while turns_played < turns and engine.player.is_alive:
+        handler.handle_action(policy(engine))
+        turns_played += 1
+        if engine.player.level.requires_level_up:
+            # There is no one to ask, so always pick the first option of the level up menu.
+            engine.player.level.increase_max_hp()
+        if console is not None:
+            with instrumentation.span("render"):
+                console.clear()
+                engine.render(console)
+    return engine, turns_played
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run the game headless and report turn throughput.")
+    parser.add_argument("--turns", type=int, default=1000)
+    parser.add_argument("--policy", choices=sorted(POLICIES), default="random")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--render", action="store_true", help="Render every turn into an off-screen console.")
+    parser.add_argument("--instrument", action="store_true", help="Print per-turn timing spans and counters at exit.")
+    parser.add_argument("--map-size", default="80x43", help="Map size as WIDTHxHEIGHT.")
+    parser.add_argument(
+        "--chunk-size", type=int, default=None,
+        help="Generate chunked maps with this chunk size, lazily as the player explores.",
+    )
+    parser.add_argument("--map-directory", default=None, help="Keep the map layers in memory-mapped files here.")
+    parser.add_argument("--prefetch", action="store_true", help="Generate the next floor in a background process.")
+    args = parser.parse_args()
+    map_width, map_height = (int(size) for size in args.map_size.lower().split("x"))
+
+    if args.instrument:
+        instrumentation.enable(dump_at_exit=True)
+
+    if args.seed is not None:
+        random.seed(args.seed)
+    console = Console(80, 50, order="F") if args.render else None
+
+    start = time.perf_counter()
+    engine = setup_game.new_game(
+        map_width=map_width,
+        map_height=map_height,
+        chunk_size=args.chunk_size,
+        map_directory=args.map_directory,
+        prefetch=args.prefetch,
+        seed=args.seed,
+    )
+    engine, turns_played = simulate(args.turns, POLICIES[args.policy], engine=engine, console=console)
+    elapsed = time.perf_counter() - start
+
+    print(
+        f"{turns_played} turns, floor {engine.game_world.current_floor}, "
+        f"player {'alive' if engine.player.is_alive else 'dead'}, "
+        f"{elapsed:.3f} s ({turns_played / elapsed:.0f} turns/s)"
+    )
+
+
+if __name__ == "__main__":
+    main()
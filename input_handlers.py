@@ -1,6 +1,7 @@
 from __future__ import annotations
+import itertools
 import os
-from typing import Callable, Optional, Tuple, TYPE_CHECKING, Union
+from typing import Callable, Hashable, Optional, Tuple, TYPE_CHECKING, Union
 
 import tcod.event
 
@@ -14,6 +15,7 @@ from actions import (
 
 import color
 import exceptions
+import instrumentation
 
 if TYPE_CHECKING:
     from engine import Engine
@@ -76,6 +78,16 @@ If an action is returned it will be attempted if it's valid then MainGameEventHa
 
 
 class BaseEventHandler(tcod.event.EventDispatch[ActionOrHandler]):
+    # Tælles op når handlerens egen tilstand ændres på en måde som kan ses, se `render_key`.
+    generation: int = 0
+
+    def render_key(self) -> Hashable:
+        """Ændres hver gang det `on_render` tegner kan have ændret sig.
+
+        `main.main` springer rendering og present over, så længe nøglen er den samme som ved sidste frame.
+        """
+        return self, self.generation
+
     def handle_events(self, event: tcod.event.Event) -> BaseEventHandler:
         """Handle an event and return the next active event handler. """
         state = self.dispatch(event)  # Sends the event to an ev_* function.
@@ -113,6 +125,9 @@ class PopupMessage(BaseEventHandler):
             alignment=tcod.CENTER,
         )
 
+    def render_key(self) -> Hashable:
+        return self, self.generation, self.parent.render_key()
+
     def ev_keydown(self, event: tcod.event.KeyDown) -> Optional[BaseEventHandler]:
         """Any key returns to the parent handler."""
         return self.parent
@@ -147,15 +162,23 @@ class EventHandler(BaseEventHandler):
         if action is None:
             return False
 
+        self.engine.generation += 1  # Handlingen kan ændre alt på skærmen, også hvis den er umulig.
         try:
-            action.perform()
-        except exceptions.Impossible as e:
-            self.engine.message_log.add_message(e.args[0], color.impossible)
-            return False  # Skip enemy turn on exception
-
-        self.engine.handle_enemy_turns()
-        self.engine.update_fov()
-        return True
+            try:
+                with instrumentation.span("player_action"):
+                    action.perform()
+            except exceptions.Impossible as e:
+                self.engine.message_log.add_message(e.args[0], color.impossible)
+                return False  # Skip enemy turn on exception
+
+            with instrumentation.span("enemy_turns"):
+                self.engine.handle_enemy_turns()
+            with instrumentation.span("update_fov"):
+                self.engine.update_fov()
+            self.engine.turn += 1
+            return True
+        finally:
+            instrumentation.end_turn()
 
     def ev_quit(self, event: tcod.event.Quit):
         """ Override af EventHandler.ev_quit, sørger for lukning af programmet. """
@@ -164,9 +187,22 @@ class EventHandler(BaseEventHandler):
     def on_render(self, console: tcod.Console):
         self.engine.render(console)
 
+    def render_key(self) -> Hashable:
+        engine = self.engine
+        return self, self.generation, engine.generation, engine.message_log.generation, engine.mouse_location
+
     def ev_mousemotion(self, event):
-        if self.engine.game_map.in_bounds(event.tile.x, event.tile.y):
-            self.engine.mouse_location = event.tile.x, event.tile.y
+        location = self.map_location(*event.tile)
+        if location is not None:
+            self.engine.mouse_location = location
+
+    def map_location(self, screen_x: int, screen_y: int) -> Optional[Tuple[int, int]]:
+        """Returnerer kort-koordinatet for en `tile` på skærmen, eller None hvis kortet ikke er tegnet der."""
+        x1, y1, x2, y2 = self.engine.game_map.view
+        x, y = screen_x + x1, screen_y + y1
+        if x1 <= x < x2 and y1 <= y < y2 and self.engine.game_map.in_bounds(x, y):
+            return x, y
+        return None
 
 
 class MainGameEventHandler(EventHandler):
@@ -206,6 +242,8 @@ class MainGameEventHandler(EventHandler):
             return CharacterScreenEventHandler(self.engine)
         elif key == tcod.event.K_MINUS:
             return LookHandler(self.engine)
+        elif key == tcod.event.K_F12 and instrumentation.enabled:
+            instrumentation.dump()
 
         # Hvis en ikke valid tast blev trykket
         return action
@@ -244,11 +282,12 @@ class HistoryViewer(EventHandler):
             1,
             log_console.width - 2,
             log_console.height - 2,
-            self.engine.message_log.messages[: self.cursor + 1],
+            list(itertools.islice(self.engine.message_log.messages, self.cursor + 1)),
         )
         log_console.blit(console, 3, 3)
 
     def ev_keydown(self, event):
+        self.generation += 1  # `cursor` flytter sig, eller handleren skiftes ud.
         # Fancy conditional movement to make it feel right
         if event.sym in CURSOR_Y_KEYS:
             adjust = CURSOR_Y_KEYS[event.sym]
@@ -397,8 +436,9 @@ class SelectIndexHandler(AskUserEventHandler):
         """ Highlight the tile under the cursor. """
         super().on_render(console)
         x, y = self.engine.mouse_location
-        console.tiles_rgb['bg'][x, y] = color.white
-        console.tiles_rgb['fg'][x, y] = color.black
+        view_x, view_y, _, _ = self.engine.game_map.view
+        console.tiles_rgb['bg'][x - view_x, y - view_y] = color.white
+        console.tiles_rgb['fg'][x - view_x, y - view_y] = color.black
 
     def ev_keydown(self, event) -> Optional[Action]:
         """ Check for key movements or confirmation keys. """
@@ -417,9 +457,10 @@ class SelectIndexHandler(AskUserEventHandler):
             x += dir_x * modifier
             y += dir_y * modifier
 
-            # Clamp the cursor index to the map size
-            x = max(0, min(x, self.engine.game_map.width - 1))
-            y = max(0, min(y, self.engine.game_map.height - 1))
+            # Clamp the cursor index to the part of the map on screen
+            x1, y1, x2, y2 = self.engine.game_map.view
+            x = max(x1, min(x, x2 - 1))
+            y = max(y1, min(y, y2 - 1))
             self.engine.mouse_location = x, y
             return None
 
@@ -429,9 +470,10 @@ class SelectIndexHandler(AskUserEventHandler):
 
     def ev_mousebuttondown(self, event):
         """ Left click confirms a selection. """
-        if self.engine.game_map.in_bounds(*event.tile):
+        location = self.map_location(*event.tile)
+        if location is not None:
             if event.button == 1:
-                return self.on_index_selected(*event.tile)
+                return self.on_index_selected(*location)
 
         return super().ev_mousebuttondown(event)
 
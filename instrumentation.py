@@ -0,0 +1,117 @@
+"""Lightweight timing spans and counters for finding out where a turn's time goes.
+
+Disabled by default, in which case `span` and `count` do almost nothing.
+When enabled, every span duration and the per-turn counter totals are kept in a rolling window:
+
+    instrumentation.enable()
+    with instrumentation.span("enemy_turns"):
+        engine.handle_enemy_turns()
+    instrumentation.count("messages_added")
+    instrumentation.end_turn()
+    instrumentation.dump()
+"""
+from __future__ import annotations
+
+import atexit
+import collections
+import contextlib
+import sys
+import time
+from typing import ContextManager, Deque, Dict, List, Optional, TextIO
+
+WINDOW = 1000
+"""Number of samples kept per span, and number of turns kept for counters."""
+
+enabled = False
+
+_span_samples: Dict[str, Deque[float]] = {}
+_counters: Dict[str, int] = collections.defaultdict(int)
+_turn_counters: Deque[Dict[str, int]] = collections.deque(maxlen=WINDOW)
+_null_span = contextlib.nullcontext()
+_atexit_registered = False
+
+
+class _Span:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.start = 0.0
+
+    def __enter__(self) -> None:
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info) -> None:
+        samples = _span_samples.get(self.name)
+        if samples is None:
+            samples = _span_samples[self.name] = collections.deque(maxlen=WINDOW)
+        samples.append(time.perf_counter() - self.start)
+
+
+def enable(dump_at_exit: bool = False) -> None:
+    """Start recording. If `dump_at_exit` is True the summary is printed to stderr on exit."""
+    global enabled, _atexit_registered
+    enabled = True
+    if dump_at_exit and not _atexit_registered:
+        atexit.register(dump)
+        _atexit_registered = True
+
+
+def disable() -> None:
+    global enabled
+    enabled = False
+
+
+def reset() -> None:
+    """Forget everything recorded so far."""
+    _span_samples.clear()
+    _counters.clear()
+    _turn_counters.clear()
+
+
+def span(name: str) -> ContextManager[None]:
+    """Time the body of a `with` block under `name`."""
+    if not enabled:
+        return _null_span
+    return _Span(name)
+
+
+def count(name: str, amount: int = 1) -> None:
+    """Add `amount` to the counter `name` for the current turn."""
+    if enabled:
+        _counters[name] += amount
+
+
+def end_turn() -> None:
+    """Close the current turn, moving its counter totals into the rolling window."""
+    if enabled:
+        _turn_counters.append(dict(_counters))
+        _counters.clear()
+
+
+def summary() -> str:
+    """Return a human readable summary of the rolling window."""
+    lines: List[str] = [f"Spans (last {WINDOW} samples each):"]
+    for name, samples in sorted(_span_samples.items()):
+        ordered = sorted(samples)
+        mean = sum(ordered) / len(ordered)
+        p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+        lines.append(
+            f"  {name:<20} n={len(ordered):<5} mean={mean * 1e3:8.3f} ms"
+            f"  p95={p95 * 1e3:8.3f} ms  max={ordered[-1] * 1e3:8.3f} ms"
+        )
+
+    turns = len(_turn_counters)
+    lines.append(f"Counters (mean per turn over {turns} turns):")
+    totals: Dict[str, int] = collections.defaultdict(int)
+    for turn in _turn_counters:
+        for name, value in turn.items():
+            totals[name] += value
+    for name, total in sorted(totals.items()):
+        lines.append(f"  {name:<20} {total / turns:10.1f}  (total {total})")
+    return "\n".join(lines)
+
+
+def dump(file: Optional[TextIO] = None) -> None:
+    """Print the summary, to stderr by default."""
+    print(summary(), file=file or sys.stderr)
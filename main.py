@@ -1,19 +1,26 @@
 #!/usr/bin/env python3
 import copy
+import os
 import traceback
 
 import tcod
 
+from autosave import AutoSaver
 import color
 import exceptions
+import instrumentation
+import savefile
 import setup_game
 import input_handlers
 
+# Codec og level til saves, fx "zlib:1" for hurtige saves eller "lzma:9" for små filer.
+SAVE_COMPRESSION = os.environ.get("ROGUEPY_SAVE_COMPRESSION", savefile.DEFAULT_COMPRESSION)
+
 
 def save_game(handler: input_handlers.BaseEventHandler, filename: str) -> None:
     """If the current event handler has an active Engine, then save it."""
     if isinstance(handler, input_handlers.EventHandler):
-        handler.engine.save_as(filename)
+        handler.engine.save_as(filename, compression=SAVE_COMPRESSION)
         print("Game Saved.")
 
 
@@ -22,6 +29,10 @@ def main() -> None:
     screen_width = 80  # X-Coordinate
     screen_height = 50  # Y-Coordinate
 
+    if os.environ.get("ROGUEPY_INSTRUMENT"):
+        # Tid og tællere pr. tur, F12 dumper et sammendrag og det printes også ved exit.
+        instrumentation.enable(dump_at_exit=True)
+
     tileset = tcod.tileset.load_tilesheet(
         "resources/tileset10x10.png",
         32,
@@ -30,6 +41,7 @@ def main() -> None:
     )
 
     handler: input_handlers.BaseEventHandler = setup_game.MainMenu()
+    autosaver = AutoSaver("savegame.sav", every_n_turns=50, incremental=True, compression=SAVE_COMPRESSION)
 
     with tcod.context.new_terminal(
             screen_width,
@@ -41,29 +53,47 @@ def main() -> None:
         root_console = tcod.Console(screen_width, screen_height,
                                     order="F")  # `order="F"` sætter coordinat-systemet til `[x, y]`
         try:
+            frame_key = None  # `handler.render_key()` for den frame som vises nu.
             while True:
-                root_console.clear()
-                handler.on_render(console=root_console)
-                context.present(root_console)
+                render_key = handler.render_key()
+                if render_key != frame_key:
+                    with instrumentation.span("render"):
+                        root_console.clear()
+                        handler.on_render(console=root_console)
+                    with instrumentation.span("present"):
+                        context.present(root_console)
+                    frame_key = render_key
+                else:
+                    # Intet synligt har ændret sig, fx kun key-ups eller musen indenfor samme `tile`.
+                    instrumentation.count("frames_skipped")
 
                 try:
                     for event in tcod.event.wait():
                         context.convert_event(event)
+                        if isinstance(event, tcod.event.WindowEvent):
+                            frame_key = None  # Vinduet kan skulle tegnes igen, fx efter det har været skjult.
                         handler = handler.handle_events(event)
-                except Exception:  # Handle exceptions in game.
+                except Exception as exc:  # Handle exceptions in game.
                     traceback.print_exc()
                     if isinstance(handler, input_handlers.EventHandler):
+                        # Kun selve fejlen i loggen; hele tracebacken er printet ovenfor.
                         handler.engine.message_log.add_message(
-                            traceback.format_exc(),
+                            "".join(traceback.format_exception_only(type(exc), exc)).strip(),
                             color.error,
                         )
 
+                if isinstance(handler, input_handlers.EventHandler):
+                    autosaver.maybe_save(handler.engine)
+
         except exceptions.QuitWithoutSaving:
+            autosaver.close()
             raise
         except SystemExit:  # Save and quit
+            autosaver.close()  # Vent på autosave, så den ikke overskriver den sidste save.
             save_game(handler, "savegame.sav")
             raise
         except BaseException:  # Save on any other unexpected exception
+            autosaver.close()
             save_game(handler, "savegame.sav")
             raise
 
@@ -0,0 +1,106 @@
+"""Kort hvor `tiles`, `visible` og `explored` ligger i memory-mapped .npy filer.
+
+Styresystemet læser kun de sider af filerne ind som bliver brugt, så mange store etager kan
+holdes på disken på én gang. En save gemmer kun hvor filerne ligger, og fsyncer dem med `sync_layers`.
+"""
+from __future__ import annotations
+
+import os
+from typing import Iterable, Tuple, TYPE_CHECKING
+
+import numpy as np
+
+from game_map import GameMap
+import tile_types
+
+if TYPE_CHECKING:
+    from engine import Engine
+    from entity import Entity
+
+LAYERS = ("tiles", "visible", "explored")
+
+
+class MappedGameMap(GameMap):
+    """Et `GameMap` hvis lag er `np.memmap`s i `directory`.
+
+    Med `mode="w+"` oprettes nye filer fyldt med vægge, med `mode="r+"` åbnes eksisterende filer.
+    Når kortet pickles, kommer kun stien med, ikke arrays'ene.
+
+    FOV, pathfinding og Dijkstra-felter dækker kun `active_radius` tiles omkring spilleren,
+    så en tur kun læser og skriver de sider af filerne som ligger der.
+    """
+    # Klasse-default, så kort pickled før `active_radius` stadig kan indlæses.
+    active_radius: int = 40
+
+    def __init__(
+            self,
+            engine: Engine,
+            width: int,
+            height: int,
+            entities: Iterable[Entity] = (),
+            *,
+            directory: str,
+            mode: str = "w+",
+            active_radius: int = 40,
+    ):
+        self.directory = os.path.abspath(directory)
+        self.mode = mode
+        self.active_radius = active_radius
+        super().__init__(engine, width, height, entities)
+
+    def _create_layers(self, width: int, height: int) -> None:
+        if self.mode == "w+":
+            os.makedirs(self.directory, exist_ok=True)
+        self._open_layers(width, height)
+        if self.mode == "w+":
+            self.tiles[:] = tile_types.wall
+            self._visible_area = (0, 0, 0, 0)  # Nye filer har intet synligt, så `update_visible` skal ikke rydde dem.
+            # Resten af spillet åbner altid filerne igen, så de skal ikke overskrives.
+            self.mode = "r+"
+
+    def _open_layers(self, width: int, height: int) -> None:
+        for name, dtype in zip(LAYERS, (tile_types.tile_dt, bool, bool)):
+            layer = np.lib.format.open_memmap(
+                os.path.join(self.directory, f"{name}.npy"),
+                mode=self.mode,
+                dtype=dtype,
+                shape=(width, height),
+                fortran_order=True,
+            )
+            if layer.shape != (width, height) or layer.dtype != dtype:
+                raise ValueError(f"{layer.filename} does not hold a {width}x{height} {name} layer.")
+            setattr(self, name, layer)
+
+    def get_active_area(self, x: int, y: int) -> Tuple[int, int, int, int]:
+        radius = self.active_radius
+        return max(0, x - radius), max(0, y - radius), min(self.width, x + radius + 1), min(self.height, y + radius + 1)
+
+    def flush(self) -> None:
+        """Skriv ændringerne i lagene til disken."""
+        for name in LAYERS:
+            getattr(self, name).flush()
+
+    def __getstate__(self):
+        self.flush()
+        state = super().__getstate__()
+        for name in LAYERS:
+            del state[name]
+        return state
+
+    def __setstate__(self, state) -> None:
+        self.__dict__.update(state)
+        self._open_layers(self.width, self.height)
+
+
+def sync_layers(directory: str) -> None:
+    """Skriv lagene i `directory` til disken, uden at skulle have kortet.
+
+    Filerne er mappet delt, så `os.fsync` skriver også ændringer lavet gennem et `MappedGameMap`
+    i en anden proces. Det lader autosave gøre det i sin baggrundsproces i stedet for på main-tråden.
+    """
+    for name in LAYERS:
+        fd = os.open(os.path.join(directory, f"{name}.npy"), os.O_RDWR)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
@@ -1,16 +1,39 @@
-from typing import Iterable, List, Reversible, Tuple
+from collections import deque
+from typing import Deque, Iterable, List, Reversible, Tuple
 import textwrap
 
 import tcod
 
 import color
+import instrumentation
+from slotted import Slotted
 
 
-class Message:
+# Standard for hvor mange beskeder `MessageLog` husker.
+MAX_MESSAGES = 1000
+
+
+class Message(Slotted):
+	__slots__ = ('plain_text', 'fg', 'count', '_wrapped')
+
 	def __init__(self, text: str, fg: Tuple[int, int, int]):
 		self.plain_text = text
 		self.fg = fg
 		self.count = 1  # fx "Du angriber(x3)
+		self._wrapped = None  # (count, {width: linjer}) fra `wrapped`
+
+	def wrapped(self, width: int) -> List[str]:
+		""" `full_text` ombrudt til `width`. Genbruges pr. bredde, indtil `count` ændres.
+
+		Flere bredder gemmes, da fx `HistoryViewer` tegner både loggen og historikken i samme frame.
+		"""
+		cached = getattr(self, '_wrapped', None)  # Beskeder fra før cachen har ikke slot'en sat.
+		if cached is None or cached[0] != self.count:
+			cached = self._wrapped = self.count, {}
+		lines = cached[1].get(width)
+		if lines is None:
+			lines = cached[1][width] = list(MessageLog.wrap(self.full_text, width))
+		return lines
 
 	@property
 	def full_text(self) -> str:
@@ -21,8 +44,31 @@ class Message:
 
 
 class MessageLog:
-	def __init__(self):
-		self.messages: List[Message] = []
+	"""De seneste `max_messages` beskeder. Ældre beskeder falder ud, og tælles i `discarded`."""
+	# Tælles op ved hver ny eller stacket besked, så skærmen ved at loggen skal tegnes igen.
+	generation: int = 0
+
+	def __init__(self, max_messages: int = MAX_MESSAGES):
+		self.messages: Deque[Message] = deque(maxlen=max_messages)
+		self.discarded = 0  # Antal beskeder som er faldet ud af `messages`, så index 0 er besked nr. `discarded`.
+		self.generation = 0
+
+	@property
+	def max_messages(self) -> int:
+		return self.messages.maxlen
+
+	def restore(self, messages: Iterable[Message], discarded: int = 0) -> None:
+		"""Erstat beskederne, fx fra en save. Er der flere end `max_messages`, beholdes de nyeste."""
+		messages = list(messages)
+		overflow = max(0, len(messages) - self.max_messages)
+		self.messages = deque(messages[overflow:], maxlen=self.max_messages)
+		self.discarded = discarded + overflow
+		self.generation += 1
+
+	def __setstate__(self, state) -> None:
+		# Saves fra før loggen blev begrænset har en almindelig liste og ingen `discarded`.
+		self.__init__(getattr(state['messages'], 'maxlen', None) or MAX_MESSAGES)
+		self.restore(state['messages'], state.get('discarded', 0))
 
 	def add_message(
 		self,
@@ -38,9 +84,13 @@ class MessageLog:
 			fg (Tuple[int, int, int], optional): Forgrundsfarve. Defaults to color.white.
 			stack (bool, optional): Hvis True, så kan beskedens stackes, fx "Du angriber(x3). Defaults to true.
 		"""
+		instrumentation.count("messages_added")
+		self.generation += 1
 		if stack and self.messages and text == self.messages[-1].plain_text:
 			self.messages[-1].count += 1
 		else:
+			if len(self.messages) == self.max_messages:
+				self.discarded += 1
 			self.messages.append(Message(text, fg))
 
 	def render(
@@ -81,7 +131,8 @@ class MessageLog:
 	) -> None:
 		"""Render the messages provided
 
-		Beskederne er renderet baglæns fra den sidste besked
+		Beskederne er renderet baglæns fra den sidste besked, og kun indtil der ikke er mere plads,
+		så prisen afhænger af `height` og ikke af hvor lang loggen er. Ombrydningen genbruges, se `Message.wrapped`.
 
 		Args:
 			console (tcod.Console): Consolen
@@ -94,7 +145,7 @@ class MessageLog:
 		y_offset = height - 1
 
 		for message in reversed(messages):
-			for line in reversed(list(cls.wrap(message.full_text, width))):
+			for line in reversed(message.wrapped(width)):
 				console.print(x=x, y=y + y_offset, string=line, fg=message.fg)
 				y_offset -= 1
 				if y_offset < 0:
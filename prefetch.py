@@ -0,0 +1,62 @@
+"""Generer etager i en baggrundsproces, så `GameWorld.generate_floor` ikke skal vente på `procgen`.
+
+Processen har sin egen midlertidige spiller og Engine. `GameWorld` bytter dem ud med de rigtige,
+når den færdige etage tages i brug.
+"""
+from __future__ import annotations
+
+import atexit
+import concurrent.futures
+import concurrent.futures.process
+import multiprocessing
+from typing import Any, Dict, Optional, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from game_map import GameMap
+
+_executor: Optional[concurrent.futures.ProcessPoolExecutor] = None
+
+
+def submit_floor(settings: Dict[str, Any]) -> concurrent.futures.Future:
+    """Start `generate_detached_floor(settings)` i baggrundsprocessen, som startes første gang.
+
+    Hvis processen er død (fx dræbt af styresystemet), startes en ny.
+    """
+    try:
+        return _get_executor().submit(generate_detached_floor, settings)
+    except concurrent.futures.process.BrokenProcessPool:
+        shutdown()
+        return _get_executor().submit(generate_detached_floor, settings)
+
+
+def _get_executor() -> concurrent.futures.ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        # "spawn" i stedet for fork, da autosave kører i en tråd og fork kun kopierer den kaldende tråd.
+        # Kræver at hovedmodulet har en `if __name__ == "__main__"` guard, som main.py og headless.py har.
+        _executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=1, mp_context=multiprocessing.get_context("spawn"),
+        )
+        atexit.register(shutdown)
+    return _executor
+
+
+def shutdown() -> None:
+    """Stop baggrundsprocessen, og drop etager der ikke er begyndt på endnu."""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+def generate_detached_floor(settings: Dict[str, Any]) -> GameMap:
+    """Kører i baggrundsprocessen: generer en etage med `procgen.generate_dungeon` og en midlertidig spiller.
+
+    `settings` indeholder etagens egen RNG, så etagen bliver den samme som hvis den var genereret i spillet.
+    """
+    from engine import Engine
+    import entity_factories
+    from procgen import generate_dungeon
+
+    engine = Engine(player=entity_factories.player.clone())
+    return generate_dungeon(engine=engine, **settings)
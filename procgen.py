@@ -1,16 +1,20 @@
 from __future__ import annotations
 
 import random
-from typing import Iterator, List, Tuple, TYPE_CHECKING
+from typing import Dict, List, Optional, Tuple, TYPE_CHECKING
 
-import tcod
+import numpy as np
 
+from chunked_map import ChunkedGameMap
 import entity_factories
 from game_map import GameMap
+from mapped_map import MappedGameMap
+import rng as rng_streams
 import tile_types
 
 if TYPE_CHECKING:
     from engine import Engine
+    from entity import Entity
 
 
 class RectangularRoom:
@@ -49,6 +53,15 @@ class RectangularRoom:
         """
         return slice(self.pos_x + 1, self.room_width), slice(self.pos_y + 1, self.room_height)
 
+    @property
+    def outer(self):
+        """Returnerer hele rummet inklusiv væggene som et 2D array index
+
+        Returns:
+        tuple(slice, slice): De felter som `intersects` sammenligner.
+        """
+        return slice(self.pos_x, self.room_width + 1), slice(self.pos_y, self.room_height + 1)
+
     def intersects(self, other: RectangularRoom):
         return (
                 self.pos_x <= other.room_width
@@ -67,6 +80,9 @@ def generate_dungeon(
         max_monsters_per_room: int,
         max_items_per_room: int,
         engine: Engine,
+        directory: Optional[str] = None,
+        rng: Optional[random.Random] = None,
+        rooms: Optional[List[RectangularRoom]] = None,
 ) -> GameMap:
     """Genererer et Dungeon Map
 
@@ -77,27 +93,39 @@ def generate_dungeon(
          map_width (int): Hele Dungeons bredde
          map_height (int): Hele Dungeons højde
          player ([type]): Player entity
+         directory (str): Gem kortets lag i memory-mapped filer i denne mappe, se `MappedGameMap`.
+         rng (random.Random): Tilfældighedskilde, se `GameWorld.rng`. Defaults to `random` modulet.
+         rooms (list): Hvis givet, tilføjes de placerede rum til listen.
 
      Returns:
         GameMap: Området hvor PCen er.
     """
+    rng = rng or random
     player = engine.player
-    dungeon = GameMap(engine, map_width, map_height, entities=[player, ])
+    if directory is None:
+        dungeon = GameMap(engine, map_width, map_height, entities=[player, ])
+    else:
+        dungeon = MappedGameMap(engine, map_width, map_height, entities=[player, ], directory=directory)
 
-    rooms: List[RectangularRoom] = []
+    if rooms is None:
+        rooms = []
     center_of_last_room = (0, 0)
+    # Felterne som de placerede rum dækker, inklusiv vægge. Et nyt rum skærer et andet (som i `intersects`)
+    # netop når det dækker et optaget felt, så hvert forsøg koster det samme uanset hvor mange rum der er.
+    occupied = np.zeros((dungeon.width, dungeon.height), dtype=bool, order="F")
 
     for room in range(max_rooms):
-        room_width = random.randint(room_min_size, room_max_size)
-        room_height = random.randint(room_min_size, room_max_size)
+        room_width = rng.randint(room_min_size, room_max_size)
+        room_height = rng.randint(room_min_size, room_max_size)
 
-        pos_x = random.randint(0, dungeon.width - room_width - 1)
-        pos_y = random.randint(0, dungeon.height - room_height - 1)
+        pos_x = rng.randint(0, dungeon.width - room_width - 1)
+        pos_y = rng.randint(0, dungeon.height - room_height - 1)
 
         new_room = RectangularRoom(pos_x, pos_y, room_width, room_height)
 
-        if any(new_room.intersects(other_room) for other_room in rooms):
+        if occupied[new_room.outer].any():
             continue
+        occupied[new_room.outer] = True
 
         dungeon.tiles[new_room.inner] = tile_types.floor
 
@@ -105,11 +133,11 @@ def generate_dungeon(
             # Første rum, hvor spilleren starter
             player.place(*new_room.center, dungeon)
         else:
-            for x, y in tunnel_between(rooms[-1].center, new_room.center):
-                dungeon.tiles[x, y] = tile_types.floor
+            for leg in tunnel_between(rooms[-1].center, new_room.center, rng):
+                dungeon.tiles[leg] = tile_types.floor
             center_of_last_room = new_room.center
 
-        place_entities(new_room, dungeon, max_monsters_per_room, max_items_per_room)
+        place_entities(new_room, dungeon, max_monsters_per_room, max_items_per_room, rng)
 
         dungeon.tiles[center_of_last_room] = tile_types.down_stairs
         dungeon.downstairs_location = center_of_last_room
@@ -119,67 +147,230 @@ def generate_dungeon(
     return dungeon
 
 
-def place_entities(room, dungeon: GameMap, maximum_monsters: int, maximum_items: int):
+def generate_chunked_dungeon(
+        room_min_size: int,
+        room_max_size: int,
+        map_width: int,
+        map_height: int,
+        max_monsters_per_room: int,
+        max_items_per_room: int,
+        engine: Engine,
+        chunk_size: int = 32,
+        seed: Optional[int] = None,
+) -> ChunkedGameMap:
+    """Genererer et stort dungeon, hvor hver chunk først genereres når den kommer tæt på spilleren.
+
+    Spilleren starter i rummet i kortets midterste chunk, og trappen ned er et par chunks derfra.
+
+     Args:
+         chunk_size (int): Bredde og højde på en chunk. Skal have plads til et rum på `room_max_size`.
+         seed (int): Seed til generatoren. Defaults to et tilfældigt seed.
+    """
+    if seed is None:
+        seed = random.getrandbits(32)
+    generator = ChunkGenerator(
+        seed=seed,
+        room_min_size=room_min_size,
+        room_max_size=room_max_size,
+        max_monsters_per_room=max_monsters_per_room,
+        max_items_per_room=max_items_per_room,
+    )
+    dungeon = ChunkedGameMap(
+        engine, map_width, map_height, generate_chunk=generator, chunk_size=chunk_size,
+    )
+
+    start = generator.start_chunk(dungeon)
+    # Spilleren placeres før chunken genereres, så der ikke spawnes monstre oven i den.
+    engine.player.place(*generator.room(dungeon, *start).center, dungeon)
+    dungeon.downstairs_location = generator.room(dungeon, *generator.stairs_chunk(dungeon, *start)).center
+    dungeon.get_active_area(engine.player.x, engine.player.y)
+    return dungeon
+
+
+class ChunkGenerator:
+    """Genererer én chunk af et `ChunkedGameMap`: et rum, og tunneller fra rummet til dørene i kanterne.
+
+    Alt afhænger kun af `seed` og chunkens (cx, cy), så en chunk bliver ens uanset hvornår den genereres,
+    og to nabo-chunks er enige om hvor døren mellem dem er, så hele kortet hænger sammen.
+    """
+
+    def __init__(
+            self,
+            seed: int,
+            room_min_size: int,
+            room_max_size: int,
+            max_monsters_per_room: int,
+            max_items_per_room: int,
+            stairs_distance: int = 3,
+    ):
+        self.seed = seed
+        self.room_min_size = room_min_size
+        self.room_max_size = room_max_size
+        self.max_monsters_per_room = max_monsters_per_room
+        self.max_items_per_room = max_items_per_room
+        self.stairs_distance = stairs_distance
+
+    def __call__(self, dungeon: ChunkedGameMap, cx: int, cy: int) -> None:
+        rng = self._rng("chunk", cx, cy)
+        room = self._room(rng, dungeon, cx, cy)
+        dungeon.tiles[room.inner] = tile_types.floor
+
+        size = dungeon.chunk_size
+        x1, y1 = cx * size, cy * size
+        x2, y2 = min(dungeon.width, x1 + size), min(dungeon.height, y1 + size)
+        doors = []
+        if cx > 0:
+            doors.append((x1, self._door(y1, y2, "x", cx - 1, cy)))
+        if x2 < dungeon.width:
+            doors.append((x2 - 1, self._door(y1, y2, "x", cx, cy)))
+        if cy > 0:
+            doors.append((self._door(x1, x2, "y", cx, cy - 1), y1))
+        if y2 < dungeon.height:
+            doors.append((self._door(x1, x2, "y", cx, cy), y2 - 1))
+        for door in doors:
+            for leg in tunnel_between(room.center, door, rng):
+                dungeon.tiles[leg] = tile_types.floor
+
+        if (cx, cy) == self.stairs_chunk(dungeon, *self.start_chunk(dungeon)):
+            dungeon.tiles[room.center] = tile_types.down_stairs
+
+        if room.room_width - room.pos_x > 1 and room.room_height - room.pos_y > 1:
+            place_entities(room, dungeon, self.max_monsters_per_room, self.max_items_per_room, rng)
+
+    def room(self, dungeon: ChunkedGameMap, cx: int, cy: int) -> RectangularRoom:
+        """Rummet i chunk (cx, cy), uden at generere chunken."""
+        return self._room(self._rng("chunk", cx, cy), dungeon, cx, cy)
+
+    def stairs_chunk(self, dungeon: ChunkedGameMap, cx: int, cy: int) -> Tuple[int, int]:
+        """Chunken med trappen ned, `stairs_distance` chunks fra (cx, cy) i en tilfældig retning."""
+        rng = self._rng("stairs")
+        size = dungeon.chunk_size
+        max_cx, max_cy = (dungeon.width - 1) // size, (dungeon.height - 1) // size
+        dir_x, dir_y = rng.choice([(1, 0), (-1, 0), (0, 1), (0, -1), (1, 1), (-1, -1), (1, -1), (-1, 1)])
+        stairs = (
+            min(max(cx + dir_x * self.stairs_distance, 0), max_cx),
+            min(max(cy + dir_y * self.stairs_distance, 0), max_cy),
+        )
+        if stairs == (cx, cy):  # Kortet er for lille til afstanden.
+            stairs = (max_cx - cx, max_cy - cy)
+        return stairs
+
+    @staticmethod
+    def start_chunk(dungeon: ChunkedGameMap) -> Tuple[int, int]:
+        """Chunken i midten af kortet, hvor spilleren starter."""
+        return dungeon.width // 2 // dungeon.chunk_size, dungeon.height // 2 // dungeon.chunk_size
+
+    def _rng(self, *key) -> random.Random:
+        return rng_streams.derive(self.seed, *key)
+
+    def _room(self, rng: random.Random, dungeon: ChunkedGameMap, cx: int, cy: int) -> RectangularRoom:
+        size = dungeon.chunk_size
+        x1, y1 = cx * size, cy * size
+        # Chunks i kanten af kortet kan være mindre end `chunk_size`.
+        chunk_width, chunk_height = min(size, dungeon.width - x1), min(size, dungeon.height - y1)
+        room_width = max(0, min(rng.randint(self.room_min_size, self.room_max_size), chunk_width - 1))
+        room_height = max(0, min(rng.randint(self.room_min_size, self.room_max_size), chunk_height - 1))
+        return RectangularRoom(
+            x1 + rng.randint(0, chunk_width - 1 - room_width),
+            y1 + rng.randint(0, chunk_height - 1 - room_height),
+            room_width,
+            room_height,
+        )
+
+    def _door(self, start: int, stop: int, axis: str, cx: int, cy: int) -> int:
+        """Positionen af døren på kanten mellem chunk (cx, cy) og dens nabo på `axis`, langs kanten [start, stop)."""
+        rng = self._rng("door", axis, cx, cy)
+        return rng.randint(start + 1, max(start + 1, stop - 2)) if stop - start > 2 else start
+
+
+def place_entities(
+        room, dungeon: GameMap, maximum_monsters: int, maximum_items: int, rng: Optional[random.Random] = None,
+):
     """Funktion som finder X og Y koordinater til placering og spawning af NPCer.
 
     Hvis en `entity`s X/Y-koordinat ville være oven på en andens så vil den ikke spawnes.
     Der er også en 80% chance for at en anden type `monster` vil spawnes ved hver spawn.
 
+    Positionerne tjekkes mod en maske af rummets ledige gulvfelter, og hver type spawnes med ét
+    `Entity.spawn_many` kald. Trækkene fra `rng` er de samme som et felt ad gangen, så et seed giver samme placeringer.
+
     Args:
         room ([type]): [description]
         dungeon ([type]): [description]
         maximum_monsters ([type]): [description]
+        rng (random.Random): Tilfældighedskilde. Defaults to `random` modulet.
     """
-    number_of_monsters = random.randint(0, maximum_monsters)
-    number_of_items = random.randint(0, maximum_items)
+    rng = rng or random
+    number_of_monsters = rng.randint(0, maximum_monsters)
+    number_of_items = rng.randint(0, maximum_items)
 
-    for _ in range(number_of_monsters):
+    inner_x, inner_y = room.inner
+    free = np.array(dungeon.tiles["walkable"][room.inner], dtype=bool)
+    for entity in dungeon.get_entities_in_rect(inner_x.start, inner_y.start, inner_x.stop, inner_y.stop):
+        free[entity.x - inner_x.start, entity.y - inner_y.start] = False
+    spawns: Dict[Entity, List[Tuple[int, int]]] = {}
+
+    def take_free_tile() -> Optional[Tuple[int, int]]:
         # Note +/-1 for ikke at spawne entities inde i væg
-        x = random.randint(room.pos_x + 1, room.room_width - 1)
-        y = random.randint(room.pos_y + 1, room.room_height - 1)
+        x = rng.randint(room.pos_x + 1, room.room_width - 1)
+        y = rng.randint(room.pos_y + 1, room.room_height - 1)
+        if not free[x - inner_x.start, y - inner_y.start]:
+            return None
+        free[x - inner_x.start, y - inner_y.start] = False
+        return x, y
 
-        if not any(entity.x == x and entity.y == y for entity in dungeon.entities):
-            if random.random() < 0.8:
-                entity_factories.orc.spawn(dungeon, x, y)
+    for _ in range(number_of_monsters):
+        position = take_free_tile()
+        if position:
+            if rng.random() < 0.8:
+                spawns.setdefault(entity_factories.orc, []).append(position)
             else:
-                entity_factories.troll.spawn(dungeon, x, y)
+                spawns.setdefault(entity_factories.troll, []).append(position)
 
     for i in range(number_of_items):
-        x = random.randint(room.pos_x + 1, room.room_width - 1)
-        y = random.randint(room.pos_y + 1, room.room_height - 1)
-
-        if not any(entity.x == x and entity.y == y for entity in dungeon.entities):
-            item_chance = random.random()
+        position = take_free_tile()
+        if position:
+            item_chance = rng.random()
 
             if item_chance < 0.1:
-                entity_factories.health_potion.spawn(dungeon, x, y)
+                spawns.setdefault(entity_factories.health_potion, []).append(position)
             elif item_chance < 0.8:
-                entity_factories.fireball_scroll.spawn(dungeon, x, y)
+                spawns.setdefault(entity_factories.fireball_scroll, []).append(position)
             elif item_chance < 0.9:
-                entity_factories.confusion_scroll.spawn(dungeon, x, y)
+                spawns.setdefault(entity_factories.confusion_scroll, []).append(position)
             else:
-                entity_factories.lightning_scroll.spawn(dungeon, x, y)
+                spawns.setdefault(entity_factories.lightning_scroll, []).append(position)
 
+    for prototype, positions in spawns.items():
+        xs, ys = zip(*positions)
+        prototype.spawn_many(dungeon, xs, ys)
 
-def tunnel_between(start: Tuple[int, int], end: Tuple[int, int]) -> Iterator[Tuple[int, int]]:
-    """Returner en L-formet tunnel mellem de to punkter
+
+def tunnel_between(
+        start: Tuple[int, int], end: Tuple[int, int], rng: Optional[random.Random] = None,
+) -> Tuple[Tuple[slice, slice], Tuple[slice, slice]]:
+    """Returner en L-formet tunnel mellem de to punkter, som de to ben i 2D array index
+
+    Begge ben er vandrette eller lodrette, så hvert af dem kan graves med én tildeling til `tiles`.
 
     Args:
         start ([type]): [description]
         end ([type]): [description]
+        rng (random.Random): Tilfældighedskilde. Defaults to `random` modulet.
     """
     start_x, start_y = start
     end_x, end_y = end
 
-    if random.random() < 0.5:
+    if (rng or random).random() < 0.5:
         # Først horizontalt, så vertikalt
         corner_x, corner_y = end_x, start_y
     else:
         # Først Vertikalt, så horizontalt
         corner_x, corner_y = start_x, end_y
 
-    # https://en.wikipedia.org/wiki/Bresenham%27s_line_algorithm
-    for x, y in tcod.los.bresenham((start_x, start_y), (corner_x, corner_y)).tolist():
-        yield x, y
-    for x, y in tcod.los.bresenham((corner_x, corner_y), (end_x, end_y)).tolist():
-        yield x, y
+    return _straight_leg(start_x, start_y, corner_x, corner_y), _straight_leg(corner_x, corner_y, end_x, end_y)
+
+
+def _straight_leg(x1: int, y1: int, x2: int, y2: int) -> Tuple[slice, slice]:
+    """Felterne fra (x1, y1) til (x2, y2), begge inklusiv, på en vandret eller lodret linje."""
+    return slice(min(x1, x2), max(x1, x2) + 1), slice(min(y1, y2), max(y1, y2) + 1)
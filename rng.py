@@ -0,0 +1,11 @@
+"""Deterministiske RNGs afledt af et seed.
+
+Etager, chunks og AI får hver deres `random.Random`, som kun afhænger af verdenens seed og en nøgle,
+så de bliver ens uanset rækkefølge, og uanset om de genereres her eller i en baggrundsproces.
+"""
+import random
+
+
+def derive(*key) -> random.Random:
+    """Returnerer en ny `random.Random` som kun afhænger af `key`, fx (seed, "floor", 3)."""
+    return random.Random(":".join(str(part) for part in key))
@@ -0,0 +1,907 @@
+"""Versioneret binært save-format.
+
+En save-fil består af en header efterfulgt af et komprimeret body med navngivne sektioner:
+
+    header:  b"RPSV" | version (uint16) | codec (uint8)
+    body:    [tag (4 bytes) | længde (uint32) | data] ...
+
+Sektionerne er:
+
+    META  JSON med engine-, world- og kort-indstillinger.
+    TILE  `tiles` som en palette af unikke tiles plus et index pr. tile.
+          For et `ChunkedGameMap` gemmes kun de genererede chunks, stablet (se `ChunkedArray.stack`),
+          og deres (cx, cy) og generatoren står i META.
+          For et `MappedGameMap` er TILE, VISI og EXPL tomme; lagene fsynces til deres filer,
+          og mappen med dem står i META. Filerne er de levende lag, så en save af et mapped kort er
+          ikke et øjebliksbillede: `tiles` ændres ikke efter genereringen, og `visible` regnes forfra
+          ved første FOV efter load, men `explored` indeholder også det der er udforsket efter saven.
+    VISI  `visible`, bit-packed.
+    EXPL  `explored`, bit-packed.
+    ENTS  JSON med entities og deres komponenter som flade tabeller, nøglet på `Entity.uid`.
+    MSGS  JSON med beskedloggen, og hvor mange ældre beskeder der er faldet ud af den (`discarded`).
+
+En inkrementel save (se `JournalWriter`) starter med b"RPSJ" og er en række længde-prefixede
+records, hver en komplet save som ovenfor. Den første record er fuld, de efterfølgende er deltaer:
+de har en DELT sektion, kun de entities der er ændret og de nye beskeder. VISI og EXPL er XOR'et
+med den forrige version, så uændrede tiles bliver til nul-bytes som komprimerer til næsten ingenting.
+For et `ChunkedGameMap` har TILE i en delta kun de nye og ændrede chunks, som står i DELT under "chunks".
+
+Body'et komprimeres med den codec der vælges med `compression` (fx "zlib:6", "lzma:1", "bz2:9" eller
+"none"), og codec'en står i headeren, så filen kan læses uanset hvad den blev gemt med.
+
+Når formatet ændres, bumpes `VERSION` og der tilføjes en funktion til `MIGRATIONS`,
+som opgraderer de afkodede sektioner fra den forrige version.
+"""
+from __future__ import annotations
+
+import bz2
+import functools
+import json
+import lzma
+import operator
+import os
+import struct
+import zlib
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple, TYPE_CHECKING
+
+import numpy as np
+
+import components.ai
+import components.consumable
+from components.fighter import Fighter
+from components.inventory import Inventory
+from components.level import Level
+from entity import Actor, Entity, Item, reserve_uids
+from message_log import Message
+from render_order import RenderOrder
+from slotted import slot_names
+import tile_types
+
+if TYPE_CHECKING:
+    from engine import Engine
+    from game_map import GameMap
+
+MAGIC = b"RPSV"
+JOURNAL_MAGIC = b"RPSJ"
+VERSION = 1
+
+_HEADER = struct.Struct("<4sHB")
+_SECTION = struct.Struct("<4sI")
+_RECORD = struct.Struct("<I")
+
+CODEC_NONE = 0
+CODEC_LZMA = 1
+CODEC_ZLIB = 2
+CODEC_BZ2 = 3
+
+
+class Codec(NamedTuple):
+    id: int
+    compress: Callable[[bytes, int], bytes]
+    decompress: Callable[[bytes], bytes]
+    default_level: int
+    levels: range
+
+
+CODECS: Dict[str, Codec] = {
+    "none": Codec(CODEC_NONE, lambda data, level: data, lambda data: data, 0, range(0, 1)),
+    "zlib": Codec(CODEC_ZLIB, zlib.compress, zlib.decompress, 6, range(0, 10)),
+    "lzma": Codec(CODEC_LZMA, lambda data, level: lzma.compress(data, preset=level), lzma.decompress, 1, range(0, 10)),
+    "bz2": Codec(CODEC_BZ2, bz2.compress, bz2.decompress, 9, range(1, 10)),
+}
+_CODECS_BY_ID = {codec.id: codec for codec in CODECS.values()}
+
+# Dataen er allerede kompakt, så et lille LZMA preset giver næsten samme størrelse som default (6),
+# uden at bruge tid på at allokere en stor ordbog. Mål selv med `python -m benchmarks.save_codecs`.
+DEFAULT_COMPRESSION = "lzma:1"
+
+Sections = Dict[bytes, bytes]
+
+MIGRATIONS: Dict[int, Callable[[Sections], Sections]] = {}
+"""Opgraderer sektionerne fra version N (nøglen) til N + 1."""
+
+_ENTITY_CLASSES = {cls.__name__: cls for cls in (Entity, Actor, Item)}
+
+
+class SaveFormatError(Exception):
+    """Raised when a file is not a save in this format, or is from a newer version."""
+
+
+def parse_compression(compression: str) -> Tuple[Codec, int]:
+    """Slå en codec op ud fra en streng som "zlib:6"; uden level bruges codec'ens default.
+
+    Raises:
+        ValueError: Hvis codec'en ikke findes eller level er udenfor det den understøtter.
+    """
+    name, _, level = compression.partition(":")
+    codec = CODECS.get(name.strip().lower())
+    if codec is None:
+        raise ValueError(f"Unknown save compression {name!r}, expected one of {', '.join(CODECS)}.")
+    if not level:
+        return codec, codec.default_level
+    try:
+        parsed_level = int(level)
+    except ValueError:
+        raise ValueError(f"Save compression level must be an integer, got {level!r}.") from None
+    if parsed_level not in codec.levels:
+        raise ValueError(
+            f"{name} compression level must be between {codec.levels.start} and {codec.levels.stop - 1}."
+        )
+    return codec, parsed_level
+
+
+def is_save_file(data: bytes) -> bool:
+    return data[:len(MAGIC)] in (MAGIC, JOURNAL_MAGIC)
+
+
+def save(engine: Engine, filename: str, compression: str = DEFAULT_COMPRESSION) -> None:
+    write_atomic(filename, dumps(engine, compression))
+
+
+def write_atomic(filename: str, data: bytes) -> None:
+    """Skriv til en midlertidig fil og omdøb den, så en afbrudt save aldrig efterlader en halv fil."""
+    temporary = f"{filename}.tmp"
+    with open(temporary, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary, filename)
+
+
+def load(filename: str) -> Engine:
+    with open(filename, 'rb') as f:
+        return loads(f.read())
+
+
+def dumps(engine: Engine, compression: str = DEFAULT_COMPRESSION) -> bytes:
+    return pack(encode_sections(engine), compression)
+
+
+def pack(sections: Sections, compression: str = DEFAULT_COMPRESSION) -> bytes:
+    """Komprimer sektionerne til en komplet save-fil.
+
+    Rører ikke ved spillets objekter, så det kan køre i en anden tråd end den der lavede sektionerne.
+    """
+    body = b"".join(
+        _SECTION.pack(tag, len(data)) + data for tag, data in sections.items()
+    )
+    codec, level = parse_compression(compression)
+    return _HEADER.pack(MAGIC, VERSION, codec.id) + codec.compress(body, level)
+
+
+def loads(data: bytes) -> Engine:
+    if data[:len(JOURNAL_MAGIC)] == JOURNAL_MAGIC:
+        return decode_sections(replay_journal(data))
+    return decode_sections(unpack(data))
+
+
+def unpack(data: bytes) -> Sections:
+    """Pak en save ud til dens sektioner, opgraderet til den nuværende version."""
+    magic, version, codec = _HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise SaveFormatError("Not a save file.")
+    if version > VERSION:
+        raise SaveFormatError(f"Save file version {version} is newer than this game ({VERSION}).")
+    if codec not in _CODECS_BY_ID:
+        raise SaveFormatError(f"Unknown compression codec {codec}.")
+    body = _CODECS_BY_ID[codec].decompress(data[_HEADER.size:])
+
+    sections: Sections = {}
+    offset = 0
+    while offset < len(body):
+        tag, length = _SECTION.unpack_from(body, offset)
+        offset += _SECTION.size
+        sections[tag] = body[offset:offset + length]
+        offset += length
+
+    while version < VERSION:
+        sections = MIGRATIONS[version](sections)
+        version += 1
+    return sections
+
+
+# --- Inkrementelle saves ----------------------------------------------------
+
+class JournalWriter:
+    """Skriver inkrementelle saves: én fuld record, efterfulgt af deltaer med kun det der er ændret.
+
+    Filen skrives forfra (kompakteres) efter `compact_every` deltaer, ved en ny etage, når tiles på et
+    almindeligt kort ændres, eller hvis filen er blevet ændret af andre siden sidst. På et `ChunkedGameMap`
+    kommer nye og ændrede chunks med i deltaen, så at gå ind i nye chunks ikke kræver en fuld record.
+    Det er kun filen og skrivningen der bliver mindre: hver `write` afkoder og sammenligner stadig hele
+    entity-tabellen og alle lagene. `write` rører ikke ved spillets objekter, så den kan køre i baggrunden.
+    """
+
+    def __init__(self, filename: str, compact_every: int = 20, compression: str = DEFAULT_COMPRESSION):
+        parse_compression(compression)
+        self.filename = filename
+        self.compact_every = compact_every
+        self.compression = compression
+        self._deltas = 0
+        self._file_size: Optional[int] = None
+        self._sections: Sections = {}
+        self._meta: Dict[str, Any] = {}
+        self._chunks: Optional[_ChunkLayers] = None
+        self._rows: Dict[int, Dict[str, Dict[str, Any]]] = {}
+        self._messages: List[List[Any]] = []
+        self._discarded = 0
+
+    def write(self, sections: Sections) -> None:
+        meta = json.loads(sections[b"META"])
+        rows = tables_to_rows(json.loads(sections[b"ENTS"]))
+        document = json.loads(sections[b"MSGS"])
+        messages, discarded = _message_rows(document), document.get("discarded", 0)
+        tiles_changed = sections[b"TILE"] != self._sections.get(b"TILE")
+
+        if (
+            self._deltas >= self.compact_every
+            or (tiles_changed and not _same_chunked_map(self._meta, meta))
+            or not self._file_unchanged()
+        ):
+            data = JOURNAL_MAGIC + _record(pack(sections, self.compression))
+            write_atomic(self.filename, data)
+            self._file_size = len(data)
+            self._deltas = 0
+            self._chunks = None
+        else:
+            delta = self._delta(sections, meta, tiles_changed, rows, messages, discarded)
+            record = _record(pack(delta, self.compression))
+            with open(self.filename, 'ab') as f:
+                f.write(record)
+                f.flush()
+                os.fsync(f.fileno())
+            self._file_size += len(record)
+            self._deltas += 1
+
+        self._sections, self._meta = sections, meta
+        self._rows, self._messages, self._discarded = rows, messages, discarded
+
+    def _file_unchanged(self) -> bool:
+        try:
+            return self._file_size == os.path.getsize(self.filename)
+        except OSError:
+            return False
+
+    def _delta(
+            self, sections: Sections, meta: Dict[str, Any], tiles_changed: bool,
+            rows, messages: List[List[Any]], discarded: int,
+    ) -> Sections:
+        delta = {b"META": sections[b"META"]}
+        removed = [uid for uid in self._rows if uid not in rows]
+        document: Dict[str, Any] = {"removed": removed}
+
+        previous = self._sections
+        if tiles_changed:
+            # Kun på et `ChunkedGameMap`: gem de nye og ændrede chunks, og XOR lagene med de gamle chunks
+            # lagt i den nye rækkefølge, hvor nye chunks er nul.
+            old = self._chunks or _decode_chunk_layers(self._sections, self._meta)
+            new = self._chunks = _decode_chunk_layers(sections, meta)
+            changed = _changed_chunks(old, new)
+            size = new.size
+            delta[b"TILE"] = encode_tiles(_stack_blocks(new.tiles, changed, size))
+            document["chunks"] = [list(new.keys[i]) for i in changed]
+            previous = {
+                tag: np.packbits(_restack(layer, old.keys, new.keys, size).ravel(order='F')).tobytes()
+                for tag, layer in ((b"VISI", old.visible), (b"EXPL", old.explored))
+            }
+        else:
+            self._chunks = None
+        for tag in (b"VISI", b"EXPL"):
+            if sections[tag] != previous[tag]:
+                delta[tag] = _xor_bytes(sections[tag], previous[tag])
+
+        changed_rows = {uid: row for uid, row in rows.items() if self._rows.get(uid) != row}
+        delta[b"ENTS"] = _dump_json(rows_to_tables(changed_rows))
+
+        # Beskeder som er faldet ud af loggen siden sidst forskyder resten, så de sammenlignes fra der.
+        old_messages = self._messages[max(0, discarded - self._discarded):]
+        unchanged = 0
+        for old_message, new_message in zip(old_messages, messages):
+            if old_message != new_message:
+                break
+            unchanged += 1
+        delta[b"MSGS"] = _dump_json(
+            {"from": unchanged, "discarded": discarded, **_message_columns(messages[unchanged:])}
+        )
+        delta[b"DELT"] = _dump_json(document)
+        return delta
+
+
+def replay_journal(data: bytes) -> Sections:
+    """Byg de fulde sektioner op fra en inkrementel save, ved at lægge deltaerne oven på den fulde record.
+
+    En halvt skrevet record til sidst (fx fra et crash under skrivning) ignoreres.
+    """
+    records = []
+    offset = len(JOURNAL_MAGIC)
+    while offset + _RECORD.size <= len(data):
+        (length,) = _RECORD.unpack_from(data, offset)
+        offset += _RECORD.size
+        if offset + length > len(data):
+            break
+        records.append(data[offset:offset + length])
+        offset += length
+    if not records:
+        raise SaveFormatError("Incremental save has no complete records.")
+
+    sections = unpack(records[0])
+    rows = tables_to_rows(json.loads(sections[b"ENTS"]))
+    document = json.loads(sections[b"MSGS"])
+    messages, discarded = _message_rows(document), document.get("discarded", 0)
+    for record in records[1:]:
+        delta = unpack(record)
+        changes = json.loads(delta[b"DELT"])
+        if "chunks" in changes:
+            _apply_chunk_delta(sections, json.loads(delta[b"META"]), delta[b"TILE"], changes["chunks"])
+        sections[b"META"] = delta[b"META"]
+        for tag in (b"VISI", b"EXPL"):
+            if tag in delta:
+                sections[tag] = _xor_bytes(sections[tag], delta[tag])
+        rows.update(tables_to_rows(json.loads(delta[b"ENTS"])))
+        for uid in changes["removed"]:
+            rows.pop(uid, None)
+        new_messages = json.loads(delta[b"MSGS"])
+        new_discarded = new_messages.get("discarded", discarded)
+        messages = messages[new_discarded - discarded:][:new_messages["from"]] + _message_rows(new_messages)
+        discarded = new_discarded
+
+    sections[b"ENTS"] = _dump_json(rows_to_tables(rows))
+    sections[b"MSGS"] = _dump_json({"discarded": discarded, **_message_columns(messages)})
+    return sections
+
+
+class _ChunkLayers(NamedTuple):
+    """Et `ChunkedGameMap`s lag afkodet fra TILE, VISI og EXPL, stablet som i `ChunkedArray.stack`."""
+    keys: List[Tuple[int, int]]
+    size: int
+    tiles: np.ndarray
+    visible: np.ndarray
+    explored: np.ndarray
+
+
+def _same_chunked_map(old_meta: Dict[str, Any], new_meta: Dict[str, Any]) -> bool:
+    """Om begge er det samme `ChunkedGameMap`, så TILE kan gemmes som en delta af chunks."""
+    if "chunks" not in old_meta.get("map", {}) or "chunks" not in new_meta["map"]:
+        return False
+    return (
+        old_meta["world"].get("current_floor") == new_meta["world"].get("current_floor")
+        and old_meta["map"]["chunks"]["chunk_size"] == new_meta["map"]["chunks"]["chunk_size"]
+    )
+
+
+def _decode_chunk_layers(sections: Sections, meta: Dict[str, Any]) -> _ChunkLayers:
+    chunks = meta["map"]["chunks"]
+    keys = [(cx, cy) for cx, cy in chunks["keys"]]
+    size = chunks["chunk_size"]
+    width = size * len(keys)
+    return _ChunkLayers(
+        keys,
+        size,
+        decode_tiles(sections[b"TILE"], width, size),
+        _unpack_bools(sections[b"VISI"], width, size),
+        _unpack_bools(sections[b"EXPL"], width, size),
+    )
+
+
+def _changed_chunks(old: _ChunkLayers, new: _ChunkLayers) -> List[int]:
+    """Index i `new.keys` for de chunks der er nye, eller hvis tiles er ændret."""
+    index = {key: i for i, key in enumerate(old.keys)}
+    size = new.size
+    changed = []
+    for i, key in enumerate(new.keys):
+        j = index.get(key)
+        if j is None or not np.array_equal(new.tiles[i * size:(i + 1) * size], old.tiles[j * size:(j + 1) * size]):
+            changed.append(i)
+    return changed
+
+
+def _stack_blocks(stacked: np.ndarray, indices: List[int], size: int) -> np.ndarray:
+    blocks = [stacked[i * size:(i + 1) * size] for i in indices]
+    if not blocks:
+        return np.empty((0, size), dtype=stacked.dtype, order='F')
+    return np.asfortranarray(np.concatenate(blocks, axis=0))
+
+
+def _restack(stacked: np.ndarray, keys: List[Tuple[int, int]], new_keys: List[Tuple[int, int]], size: int) -> np.ndarray:
+    """Læg chunks'ene fra `stacked` i rækkefølgen `new_keys`; chunks der ikke er i `keys` bliver nul."""
+    index = {key: i for i, key in enumerate(keys)}
+    out = np.zeros((size * len(new_keys), size), dtype=stacked.dtype, order='F')
+    for i, key in enumerate(new_keys):
+        j = index.get(key)
+        if j is not None:
+            out[i * size:(i + 1) * size] = stacked[j * size:(j + 1) * size]
+    return out
+
+
+def _apply_chunk_delta(sections: Sections, new_meta: Dict[str, Any], tiles: bytes, changed: List[List[int]]) -> None:
+    """Modsat `JournalWriter._delta` for chunks: læg lagene i `sections` om til `new_meta`s chunks.
+
+    VISI og EXPL bliver de gamle chunks i den nye rækkefølge, så deltaens XOR kan lægges ovenpå bagefter.
+    """
+    old = _decode_chunk_layers(sections, json.loads(sections[b"META"]))
+    keys = [(cx, cy) for cx, cy in new_meta["map"]["chunks"]["keys"]]
+    size = old.size
+    new_tiles = _restack(old.tiles, old.keys, keys, size)
+    changed_tiles = decode_tiles(tiles, size * len(changed), size)
+    index = {key: i for i, key in enumerate(keys)}
+    for j, (cx, cy) in enumerate(changed):
+        i = index[cx, cy]
+        new_tiles[i * size:(i + 1) * size] = changed_tiles[j * size:(j + 1) * size]
+    sections[b"TILE"] = encode_tiles(new_tiles)
+    for tag, layer in ((b"VISI", old.visible), (b"EXPL", old.explored)):
+        sections[tag] = np.packbits(_restack(layer, old.keys, keys, size).ravel(order='F')).tobytes()
+
+
+def _xor_bytes(a: bytes, b: bytes) -> bytes:
+    return np.bitwise_xor(np.frombuffer(a, dtype=np.uint8), np.frombuffer(b, dtype=np.uint8)).tobytes()
+
+
+def _record(data: bytes) -> bytes:
+    return _RECORD.pack(len(data)) + data
+
+
+def _message_rows(document: Dict[str, List[Any]]) -> List[List[Any]]:
+    return [list(row) for row in zip(document["text"], document["fg"], document["count"])]
+
+
+def _message_columns(rows: List[List[Any]]) -> Dict[str, List[Any]]:
+    return {
+        "text": [row[0] for row in rows],
+        "fg": [row[1] for row in rows],
+        "count": [row[2] for row in rows],
+    }
+
+
+def tables_to_rows(tables: Dict[str, Dict[str, List[Any]]]) -> Dict[int, Dict[str, Dict[str, Any]]]:
+    """Vend entity-tabellerne om til én række pr. `uid`: {uid: {tabel: {kolonne: værdi}}}."""
+    rows: Dict[int, Dict[str, Dict[str, Any]]] = {}
+    for table, columns in tables.items():
+        names = [name for name in columns if name != "uid"]
+        for i, uid in enumerate(columns["uid"]):
+            rows.setdefault(uid, {})[table] = {name: columns[name][i] for name in names}
+    return rows
+
+
+def rows_to_tables(rows: Dict[int, Dict[str, Dict[str, Any]]]) -> Dict[str, Dict[str, List[Any]]]:
+    """Det modsatte af `tables_to_rows`."""
+    tables = _empty_tables()
+    for uid, row in rows.items():
+        for table, values in row.items():
+            columns = tables[table]
+            columns["uid"].append(uid)
+            for name, value in values.items():
+                columns[name].append(value)
+    return tables
+
+
+# --- Encoding ---------------------------------------------------------------
+
+class Snapshot(NamedTuple):
+    """En billig kopi af det der skal gemmes, taget med `snapshot`.
+
+    Indeholder kun kopier af kortets lag og tuples af simple værdier, ingen referencer til spillets objekter,
+    så `encode_snapshot` kan køre i en anden tråd eller proces mens spillet fortsætter.
+    Lagene er None for et `MappedGameMap`.
+    """
+    meta: Dict[str, Any]
+    tiles: Optional[np.ndarray]
+    visible: Optional[np.ndarray]
+    explored: Optional[np.ndarray]
+    entities: List[Tuple[Any, ...]]
+    messages: List[Tuple[str, Tuple[int, int, int], int]]
+    discarded: int
+
+
+def encode_sections(engine: Engine) -> Sections:
+    return encode_snapshot(snapshot(engine))
+
+
+def snapshot(engine: Engine) -> Snapshot:
+    """Kopier det der skal gemmes. Det dyre (palette, packbits og JSON) sker først i `encode_snapshot`."""
+    game_map = engine.game_map
+    world = engine.game_world
+    meta = {
+        "engine": {
+            "player": entity_uid(engine.player),
+            "mouse_location": list(engine.mouse_location),
+            "fov_radius": engine.fov_radius,
+            "fov_algorithm": engine.fov_algorithm,
+            "turn": engine.turn,
+        },
+        "world": {
+            **{name: value for name, value in vars(world).items() if name != 'engine' and not name.startswith('_')},
+            # Eksplicit, da en world fra en pickled save kun har klasse-defaulten, som `vars` ikke ser.
+            "seed": world.seed,
+        },
+        "map": {
+            "width": game_map.width,
+            "height": game_map.height,
+            "downstairs_location": list(game_map.downstairs_location),
+            "transparency_generation": game_map.transparency_generation,
+        },
+    }
+    tiles, visible, explored = snapshot_layers(game_map, meta["map"])
+    return Snapshot(
+        meta,
+        tiles,
+        visible,
+        explored,
+        snapshot_entities(game_map, engine.player),
+        [(message.plain_text, message.fg, message.count) for message in engine.message_log.messages],
+        engine.message_log.discarded,
+    )
+
+
+def encode_snapshot(snapshot: Snapshot) -> Sections:
+    """Lav sektionerne ud fra et `Snapshot`. Rører ikke ved spillets objekter."""
+    if "mapped" in snapshot.meta["map"]:
+        from mapped_map import sync_layers
+        sync_layers(snapshot.meta["map"]["mapped"]["directory"])
+    return {
+        b"META": _dump_json(snapshot.meta),
+        **encode_layers(snapshot.tiles, snapshot.visible, snapshot.explored),
+        b"ENTS": _dump_json(encode_entities(snapshot.entities)),
+        b"MSGS": _dump_json({"discarded": snapshot.discarded, **encode_messages(snapshot.messages)}),
+    }
+
+
+def snapshot_layers(
+        game_map: GameMap, map_meta: Dict[str, Any],
+) -> Tuple[Optional[np.ndarray], Optional[np.ndarray], Optional[np.ndarray]]:
+    """Returnerer kopier af kortets `tiles`, `visible` og `explored`, og lægger det der ellers skal til
+    for at genskabe dem i `map_meta`."""
+    from chunked_map import ChunkedGameMap
+    from mapped_map import MappedGameMap
+
+    if isinstance(game_map, MappedGameMap):
+        # Ingen kopi og ingen flush her: lagene kan være meget store, så `encode_snapshot` fsyncer filerne.
+        map_meta["mapped"] = {"directory": game_map.directory}
+        return None, None, None
+
+    if isinstance(game_map, ChunkedGameMap):
+        # `dump_chunks` stabler chunks'ene i nye arrays, så de er allerede kopier.
+        keys, tiles, visible, explored = game_map.dump_chunks()
+        map_meta["chunks"] = {
+            "chunk_size": game_map.chunk_size,
+            "active_radius": game_map.active_radius,
+            "view": [game_map.view_width, game_map.view_height],
+            "generator": dict(vars(game_map.generate_chunk)),
+            "keys": [list(key) for key in keys],
+        }
+        return tiles, visible, explored
+    return game_map.tiles.copy(), game_map.visible.copy(), game_map.explored.copy()
+
+
+def encode_layers(
+        tiles: Optional[np.ndarray], visible: Optional[np.ndarray], explored: Optional[np.ndarray],
+) -> Sections:
+    """Returnerer TILE, VISI og EXPL, som er tomme hvis lagene er None (et `MappedGameMap`)."""
+    if tiles is None:
+        return {b"TILE": b"", b"VISI": b"", b"EXPL": b""}
+    return {
+        b"TILE": encode_tiles(tiles),
+        b"VISI": np.packbits(visible.ravel(order='F')).tobytes(),
+        b"EXPL": np.packbits(explored.ravel(order='F')).tobytes(),
+    }
+
+
+def encode_tiles(tiles: np.ndarray) -> bytes:
+    """Gem `tiles` som en palette af de unikke tiles, og et index ind i paletten for hver tile."""
+    raw = np.ascontiguousarray(tiles.ravel(order='F')).view(f"V{tiles.dtype.itemsize}")
+    palette, indices = np.unique(raw, return_inverse=True)
+    index_dtype = np.uint8 if len(palette) <= 0x100 else np.uint16
+    return (
+        struct.pack("<HH", len(palette), tiles.dtype.itemsize)
+        + palette.tobytes()
+        + indices.astype(index_dtype).tobytes()
+    )
+
+
+def entity_uid(entity: Entity) -> int:
+    """Returnerer entityens `uid`, og giver den et hvis den er fra en save fra før `uid` fandtes."""
+    try:
+        return entity.uid
+    except AttributeError:
+        entity.uid = entity.new_uid()
+        return entity.uid
+
+
+def snapshot_entities(game_map: GameMap, player: Actor) -> List[Tuple[Any, ...]]:
+    """Returnerer kortets entities (og deres inventory) som en tuple af felter pr. entity, se `encode_entities`."""
+    entities: List[Entity] = []
+    pending = list(game_map.entities)
+    if player not in game_map.entities:
+        pending.append(player)
+    while pending:
+        entity = pending.pop()
+        entities.append(entity)
+        inventory = getattr(entity, 'inventory', None)
+        if inventory is not None:
+            pending.extend(inventory.items)
+
+    rows = []
+    for entity in entities:
+        row: Tuple[Any, ...] = (entity_uid(entity), type(entity).__name__, *_entity_fields(entity))
+        if isinstance(entity, Actor):
+            row += (
+                _snapshot_ai(entity.ai),
+                _snapshot_component(entity.fighter),
+                _snapshot_component(entity.level),
+                _snapshot_component(entity.inventory),
+            )
+        elif isinstance(entity, Item):
+            row += (_snapshot_component(entity.consumable),)
+        rows.append(row)
+    return rows
+
+
+def encode_entities(rows: List[Tuple[Any, ...]]) -> Dict[str, Dict[str, List[Any]]]:
+    """Vend rækkerne fra `snapshot_entities` om til flade tabeller af kolonner."""
+    tables = _empty_tables()
+    entity_columns = [tables["entities"][name] for name in _ENTITY_COLUMNS[:-1]]
+    render_orders = tables["entities"]["render_order"]
+    for row in rows:
+        for column, value in zip(entity_columns, row):
+            column.append(value)
+        render_orders.append(row[len(_ENTITY_COLUMNS) - 1].name)
+        uid, class_name = row[0], row[1]
+        if class_name == "Actor":
+            ai, fighter, level, inventory = row[len(_ENTITY_COLUMNS):]
+            tables["ai"]["uid"].append(uid)
+            tables["ai"]["state"].append(encode_ai(ai))
+            for table, component in (("fighter", fighter), ("level", level), ("inventory", inventory)):
+                _append_component(tables[table], uid, component)
+        elif class_name == "Item":
+            tables["consumable"]["uid"].append(uid)
+            tables["consumable"]["state"].append(_component_state(row[len(_ENTITY_COLUMNS)]))
+    return tables
+
+
+_ENTITY_COLUMNS = ("uid", "class", "x", "y", "char", "color", "name", "blocks_movement", "render_order")
+_entity_fields = operator.attrgetter(*_ENTITY_COLUMNS[2:])
+
+
+def _empty_tables() -> Dict[str, Dict[str, List[Any]]]:
+    tables: Dict[str, Dict[str, List[Any]]] = {
+        "entities": {name: [] for name in _ENTITY_COLUMNS},
+        "ai": {"uid": [], "state": []},
+        "consumable": {"uid": [], "state": []},
+    }
+    for table, cls in (("fighter", Fighter), ("level", Level), ("inventory", Inventory)):
+        tables[table] = {"uid": [], **{name: [] for name in slot_names(cls) if name != 'parent'}}
+    return tables
+
+
+def _snapshot_component(component) -> Tuple[type, Tuple[Any, ...]]:
+    """Komponentens klasse og værdierne af dens slots (uden `parent`), med items som uids."""
+    cls = type(component)
+    getter, items_index = _slot_getter(cls)
+    values = getter(component)
+    if items_index is not None:
+        items = [entity_uid(item) for item in values[items_index]]
+        values = values[:items_index] + (items,) + values[items_index + 1:]
+    return cls, values
+
+
+@functools.lru_cache(maxsize=None)
+def _slot_getter(cls: type) -> Tuple[Callable[[Any], Tuple[Any, ...]], Optional[int]]:
+    """Returnerer en funktion som henter `cls`'s slots (uden `parent`) som en tuple, og hvor `items` er i den."""
+    names = [name for name in slot_names(cls) if name != 'parent']
+    items_index = names.index('items') if 'items' in names else None
+    if len(names) == 1:
+        getter = operator.attrgetter(names[0])
+        return (lambda component: (getter(component),)), items_index
+    return (operator.attrgetter(*names) if names else lambda component: ()), items_index
+
+
+def _append_component(table: Dict[str, List[Any]], uid: int, component: Tuple[type, Tuple[Any, ...]]) -> None:
+    table["uid"].append(uid)
+    for name, value in _component_state(component).items():
+        if name in table:
+            table[name].append(value)
+
+
+def _component_state(component: Tuple[type, Tuple[Any, ...]]) -> Dict[str, Any]:
+    cls, values = component
+    names = [name for name in slot_names(cls) if name != 'parent']
+    return {"type": cls.__name__, **dict(zip(names, values))}
+
+
+def _snapshot_ai(ai) -> Optional[Tuple[str, Dict[str, Any]]]:
+    """AI'ens klassenavn og en kopi af dens attributter, uden `entity`."""
+    if ai is None:
+        return None
+    state = {}
+    for name, value in vars(ai).items():
+        if name == 'entity':
+            continue
+        if name == 'previous_ai':
+            value = _snapshot_ai(value)
+        elif name == 'path':
+            value = list(value)
+        state[name] = value
+    return type(ai).__name__, state
+
+
+def encode_ai(ai: Optional[Tuple[str, Dict[str, Any]]]) -> Optional[Dict[str, Any]]:
+    if ai is None:
+        return None
+    name, state = ai
+    if "previous_ai" in state:
+        state = {**state, "previous_ai": encode_ai(state["previous_ai"])}
+    return {"type": name, **state}
+
+
+def encode_messages(messages: Iterable[Tuple[str, Tuple[int, int, int], int]]) -> Dict[str, List[Any]]:
+    return _message_columns([list(message) for message in messages])
+
+
+def _dump_json(document: Any) -> bytes:
+    return json.dumps(document, separators=(',', ':')).encode('utf-8')
+
+
+# --- Decoding ---------------------------------------------------------------
+
+def decode_sections(sections: Sections) -> Engine:
+    from engine import Engine
+    from game_map import GameMap, GameWorld
+
+    meta = json.loads(sections[b"META"])
+    entities = decode_entities(json.loads(sections[b"ENTS"]))
+    player = entities[meta["engine"]["player"]]
+
+    engine = Engine(
+        player=player,
+        fov_radius=meta["engine"]["fov_radius"],
+        fov_algorithm=meta["engine"]["fov_algorithm"],
+    )
+    engine.mouse_location = tuple(meta["engine"]["mouse_location"])
+    engine.turn = meta["engine"].get("turn", 0)
+    messages = json.loads(sections[b"MSGS"])
+    engine.message_log.restore(decode_messages(messages), messages.get("discarded", 0))
+    engine.game_world = GameWorld(engine=engine, **meta["world"])
+
+    map_meta = meta["map"]
+    width, height = map_meta["width"], map_meta["height"]
+    if "mapped" in map_meta:
+        from mapped_map import MappedGameMap
+        game_map = MappedGameMap(engine, width, height, directory=map_meta["mapped"]["directory"], mode="r+")
+    elif "chunks" in map_meta:
+        game_map = decode_chunked_map(engine, map_meta, sections)
+    else:
+        game_map = GameMap(engine, width, height)
+        game_map.tiles = decode_tiles(sections[b"TILE"], width, height)
+        game_map.visible = _unpack_bools(sections[b"VISI"], width, height)
+        game_map.explored = _unpack_bools(sections[b"EXPL"], width, height)
+    game_map.downstairs_location = tuple(map_meta["downstairs_location"])
+    game_map.transparency_generation = map_meta["transparency_generation"]
+
+    on_map = [entity for entity in entities.values() if not hasattr(entity, 'parent')]
+    for entity in on_map:
+        entity.parent = game_map
+    game_map.add_entities(on_map)
+    engine.game_map = game_map
+    return engine
+
+
+def decode_chunked_map(engine: Engine, map_meta: Dict[str, Any], sections: Sections) -> GameMap:
+    from chunked_map import ChunkedGameMap
+    from procgen import ChunkGenerator
+
+    chunks = map_meta["chunks"]
+    size = chunks["chunk_size"]
+    view_width, view_height = chunks["view"]
+    game_map = ChunkedGameMap(
+        engine,
+        map_meta["width"],
+        map_meta["height"],
+        generate_chunk=ChunkGenerator(**chunks["generator"]),
+        chunk_size=size,
+        active_radius=chunks["active_radius"],
+        view_width=view_width,
+        view_height=view_height,
+    )
+    keys = [(cx, cy) for cx, cy in chunks["keys"]]
+    stacked_width = size * len(keys)
+    game_map.restore_chunks(
+        keys,
+        decode_tiles(sections[b"TILE"], stacked_width, size),
+        _unpack_bools(sections[b"VISI"], stacked_width, size),
+        _unpack_bools(sections[b"EXPL"], stacked_width, size),
+    )
+    return game_map
+
+
+def decode_tiles(data: bytes, width: int, height: int) -> np.ndarray:
+    palette_size, itemsize = struct.unpack_from("<HH", data)
+    offset = struct.calcsize("<HH")
+    if itemsize != tile_types.tile_dt.itemsize:
+        raise SaveFormatError("Tile layout in save does not match this game.")
+    palette = np.frombuffer(data, dtype=tile_types.tile_dt, count=palette_size, offset=offset)
+    offset += palette_size * itemsize
+    index_dtype = np.uint8 if palette_size <= 0x100 else np.uint16
+    indices = np.frombuffer(data, dtype=index_dtype, offset=offset)
+    return palette[indices].reshape((width, height), order='F')
+
+
+def _unpack_bools(data: bytes, width: int, height: int) -> np.ndarray:
+    bits = np.unpackbits(np.frombuffer(data, dtype=np.uint8), count=width * height)
+    return bits.astype(bool).reshape((width, height), order='F')
+
+
+def decode_entities(tables: Dict[str, Dict[str, List[Any]]]) -> Dict[int, Entity]:
+    """Genskab entities og komponenter fra tabellerne. Returnerer dem nøglet på `uid`."""
+    rows = tables["entities"]
+    entities: Dict[int, Entity] = {}
+    for i, uid in enumerate(rows["uid"]):
+        cls = _ENTITY_CLASSES[rows["class"][i]]
+        new_entity = cls.__new__(cls)
+        new_entity.uid = uid
+        new_entity.x = rows["x"][i]
+        new_entity.y = rows["y"][i]
+        new_entity.char = rows["char"][i]
+        new_entity.color = tuple(rows["color"][i])
+        new_entity.name = rows["name"][i]
+        new_entity.blocks_movement = rows["blocks_movement"][i]
+        new_entity.render_order = RenderOrder[rows["render_order"][i]]
+        entities[uid] = new_entity
+    reserve_uids(max(entities, default=-1) + 1)
+
+    for table, cls in (("fighter", Fighter), ("level", Level), ("inventory", Inventory)):
+        columns = tables[table]
+        names = [name for name in columns if name != "uid"]
+        for i, uid in enumerate(columns["uid"]):
+            component = cls.__new__(cls)
+            for name in names:
+                setattr(component, name, columns[name][i])
+            component.parent = entities[uid]
+            setattr(entities[uid], table, component)
+
+    for uid, state in zip(tables["ai"]["uid"], tables["ai"]["state"]):
+        entities[uid].ai = decode_ai(state, entities[uid])
+    for uid, state in zip(tables["consumable"]["uid"], tables["consumable"]["state"]):
+        consumable = _decode_component(components.consumable, state)
+        consumable.parent = entities[uid]
+        entities[uid].consumable = consumable
+
+    for actor in entities.values():
+        inventory = getattr(actor, 'inventory', None)
+        if inventory is not None:
+            inventory.items = [entities[uid] for uid in inventory.items]
+            for item in inventory.items:
+                item.parent = inventory
+    return entities
+
+
+def _decode_component(module, state: Dict[str, Any]):
+    state = dict(state)
+    cls = getattr(module, state.pop("type"))
+    component = cls.__new__(cls)
+    for name, value in state.items():
+        setattr(component, name, value)
+    return component
+
+
+def decode_ai(state: Optional[Dict[str, Any]], owner: Actor):
+    if state is None:
+        return None
+    state = dict(state)
+    cls = getattr(components.ai, state.pop("type"))
+    ai = cls.__new__(cls)
+    ai.entity = owner
+    for name, value in state.items():
+        if name == 'previous_ai':
+            value = decode_ai(value, owner)
+        elif name == 'path':
+            value = [tuple(step) for step in value]
+        setattr(ai, name, value)
+    return ai
+
+
+def decode_messages(document: Dict[str, List[Any]]) -> List[Message]:
+    messages = []
+    for text, fg, count in zip(document["text"], document["fg"], document["count"]):
+        message = Message(text, tuple(fg))
+        message.count = count
+        messages.append(message)
+    return messages
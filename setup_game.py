@@ -1,12 +1,12 @@
 """Handle the loading and initialization of game sessions."""
 from __future__ import annotations
 
-import copy
 import lzma  # Compression
 import pickle  # De-, and serializing python object structure.
 import traceback
 from typing import Optional
 
+import numpy as np
 import tcod
 
 import color
@@ -14,17 +14,37 @@ from engine import Engine
 import entity_factories
 import input_handlers
 from game_map import GameWorld
+import savefile
 
 
-# Load the background image and remove the alpha channel
-background_image = tcod.image.load("resources/menu_background.png")[:, :, :3]  # RGB channels
+_background_image: Optional[np.ndarray] = None
 
 
-def new_game() -> Engine:
-    """Return a brand new game session as an Engine instance"""
-    map_width = 80
-    map_height = 43
+def get_background_image() -> np.ndarray:
+    """Return the menu background, loading it the first time the menu is rendered."""
+    global _background_image
+    if _background_image is None:
+        # Load the background image and remove the alpha channel
+        _background_image = tcod.image.load("resources/menu_background.png")[:, :, :3]  # RGB channels
+    return _background_image
 
+
+def new_game(
+        map_width: int = 80,
+        map_height: int = 43,
+        chunk_size: Optional[int] = None,
+        map_directory: Optional[str] = None,
+        prefetch: bool = False,
+        seed: Optional[int] = None,
+) -> Engine:
+    """Return a brand new game session as an Engine instance
+
+    With `chunk_size` the floors are chunked and generated as the player explores them,
+    which allows maps far larger than the screen.
+    With `map_directory` the map layers of each floor are memory-mapped files in that directory.
+    With `prefetch` the next floor is generated in a background process while the current one is played.
+    With `seed` every floor and monster is reproducible; a random seed is picked otherwise.
+    """
     room_max_size = 10
     room_min_size = 6
     max_rooms = 30
@@ -32,7 +52,7 @@ def new_game() -> Engine:
     max_monsters_per_room = 2
     max_items_per_room = 2
 
-    player = copy.deepcopy(entity_factories.player)
+    player = entity_factories.player.clone()
 
     engine = Engine(player=player)
 
@@ -45,6 +65,10 @@ def new_game() -> Engine:
         map_height=map_height,
         max_monsters_per_room=max_monsters_per_room,
         max_items_per_room=max_items_per_room,
+        chunk_size=chunk_size,
+        map_directory=map_directory,
+        prefetch=prefetch,
+        seed=seed,
     )
     engine.game_world.generate_floor()
     engine.update_fov()
@@ -57,10 +81,21 @@ def new_game() -> Engine:
 
 
 def load_game(filename: str) -> Engine:
-    """Load an engine from a file."""
+    """Load an engine from a file.
+
+    Saves from before `savefile` existed are pickled Engines, and are still loaded.
+    """
     with open(filename, 'rb') as f:
-        engine = pickle.loads(lzma.decompress(f.read()))
-    assert isinstance(engine, Engine)
+        data = f.read()
+    if savefile.is_save_file(data):
+        engine = savefile.loads(data)
+    else:
+        engine = pickle.loads(lzma.decompress(data))
+        assert isinstance(engine, Engine)
+        columns = getattr(engine.game_map, 'entity_columns', None)
+        if not hasattr(columns, 'render_order'):  # Save fra før position-indexet og kolonnerne, eller render_order.
+            engine.game_map.rebuild_index()
+    engine.game_world.prefetch_next_floor()
     return engine
 
 
@@ -69,7 +104,7 @@ class MainMenu(input_handlers.BaseEventHandler):
 
     def on_render(self, console: tcod.Console) -> None:
         """Render the main menu on a background image."""
-        console.draw_semigraphics(background_image, 0, 0)
+        console.draw_semigraphics(get_background_image(), 0, 0)
 
         console.print(
             console.width // 2,
@@ -115,6 +150,6 @@ class MainMenu(input_handlers.BaseEventHandler):
                 traceback.print_exc()
                 return input_handlers.PopupMessage(self, f"Failed to load save:\n{exc}")
         elif event.sym == tcod.event.K_n:
-            return input_handlers.MainGameEventHandler(new_game())
+            return input_handlers.MainGameEventHandler(new_game(prefetch=True))
 
         return None
\ No newline at end of file
@@ -0,0 +1,39 @@
+import functools
+from typing import Tuple, Type
+
+
+@functools.lru_cache(maxsize=None)
+def slot_names(cls: Type) -> Tuple[str, ...]:
+    """ Alle `__slots__` navne for `cls`, inklusiv dem fra base-classes. """
+    return tuple(
+        name
+        for klass in reversed(cls.__mro__)
+        for name in klass.__dict__.get('__slots__', ())
+    )
+
+
+class Slotted:
+    """ Base-class for klasser med `__slots__`, som skal kunne pickles.
+
+    Slotted objekter har ingen `__dict__`, så pickle gemmer deres state som `(None, slots)`.
+    Saves fra før klasserne fik `__slots__` har i stedet en almindelig `__dict__`,
+    så `__setstate__` accepterer begge former.
+    """
+    __slots__ = ()
+
+    def __setstate__(self, state):
+        if isinstance(state, tuple):
+            dict_state, slot_state = state
+            state = {**(dict_state or {}), **(slot_state or {})}
+        for name, value in state.items():
+            setattr(self, name, value)
+
+    def __copy__(self):
+        """ Overfladisk kopi, som kun kopierer de slots der er sat. """
+        clone = object.__new__(type(self))
+        for name in slot_names(type(self)):
+            try:
+                setattr(clone, name, getattr(self, name))
+            except AttributeError:
+                pass  # Slot er ikke sat, fx `parent` på en prototype.
+        return clone
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Modulerne ligger i roden af repoet og er ikke en installeret pakke.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))